@@ -0,0 +1,96 @@
+import io
+import os
+import orjson
+from langchain.cache import SQLiteCache
+from langchain.callbacks.base import BaseCallbackHandler
+from langchain.schema import Generation
+from langchain.schema.cache import BaseCache
+
+
+# On-disk cache of LLM responses, keyed by prompt and model configuration
+LLM_CACHE_PATH = os.path.join(os.path.expanduser("~"), ".docdash", "llm_cache", "llm_cache.db")
+
+
+def sqlite_llm_cache(cache_path=LLM_CACHE_PATH):
+    """Create the SQLite LLM response cache at cache_path, to be passed to an LLM as its own cache."""
+    os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+    return SQLiteCache(database_path=cache_path)
+
+
+def update_llm_cache(llm, prompt, text):
+    """Store a response in the LLM's own cache, for generations stopped before LangChain could cache them."""
+    if not isinstance(llm.cache, BaseCache):
+        return
+
+    # The same model configuration string LangChain looks cached responses up by
+    params = llm.dict()
+    params["stop"] = None
+    llm_string = str(sorted(params.items()))
+    llm.cache.update(prompt, llm_string, [Generation(text=text)])
+
+
+class JsonComplete(Exception):
+    """Raised from the streaming callback to stop generation once a complete JSON value has arrived."""
+
+
+class JsonStreamCollector(BaseCallbackHandler):
+    """Collect streamed LLM tokens and stop the stream once the first JSON object or array is complete.
+
+    Anything the model writes after the JSON is never generated, so it costs neither tokens nor time.
+    A bracketed value that does not parse as JSON, like "rules [R1, R2]:" in prose before the payload,
+    is skipped and the search for the JSON continues after it.
+    With strict, the bracket structure is validated as it arrives and the stream is aborted with a
+    ValueError as soon as a closing bracket does not match, so malformed responses don't decode to the end.
+    """
+    raise_error = True
+
+    def __init__(self, strict=True):
+        self.strict = strict
+        self.buffer = io.StringIO()
+        self.start = None
+        self.end = None
+        self.position = 0
+        self.open_brackets = []
+        self.in_string = False
+        self.escaped = False
+
+    def on_llm_new_token(self, token, **kwargs):
+        self.buffer.write(token)
+        for char in token:
+            if self.start is not None:
+                if self.in_string:
+                    if self.escaped:
+                        self.escaped = False
+                    elif char == "\\":
+                        self.escaped = True
+                    elif char == '"':
+                        self.in_string = False
+                elif char == '"':
+                    self.in_string = True
+                elif char in "{[":
+                    self.open_brackets.append(char)
+                elif char in "}]":
+                    expected = "{" if char == "}" else "["
+                    if self.open_brackets.pop() != expected and self.strict:
+                        raise ValueError(f"Malformed JSON in LLM response at character {self.position}")
+                    if not self.open_brackets:
+                        if self._parses(self.position + 1):
+                            self.end = self.position + 1
+                            raise JsonComplete()
+                        self.start = None
+            elif char in "{[":
+                self.start = self.position
+                self.open_brackets.append(char)
+            self.position += 1
+
+    def _parses(self, end):
+        """Check whether the bracketed value collected up to end is valid JSON."""
+        try:
+            orjson.loads(self.buffer.getvalue()[self.start:end])
+        except orjson.JSONDecodeError:
+            return False
+        return True
+
+    def text(self):
+        """Return the complete JSON value collected so far."""
+        return self.buffer.getvalue()[self.start:self.end]
@@ -0,0 +1,5 @@
+import orjson
+
+
+# orjson options for payloads and saved results, which may hold numpy values and non-string keys
+ORJSON_OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
@@ -1,83 +1,30 @@
+import io
 import os
 import re
+import asyncio
+import copy
+import difflib
 import email
-import pandas as pd
-from langchain.document_loaders import PyPDFLoader, TextLoader, UnstructuredEmailLoader
+import email.policy
+import functools
+import hashlib
+import inspect
+import json
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import tiktoken
+import fitz
+from langchain.document_loaders import TextLoader
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain.embeddings import OpenAIEmbeddings
-from langchain.vectorstores import Chroma
 from langchain.llms import OpenAI
 from langchain.chains import LLMChain
 from langchain.prompts import PromptTemplate
+from DocDash.common.llm import JsonComplete, JsonStreamCollector
 
 
-class DocumentProcessor:
-    def __init__(self, model_name="gpt-4", embedding_model="text-embedding-ada-002"):
-        """Initialize the document processor with specified LLM and embedding models."""
-        self.llm = OpenAI(model_name=model_name)
-        self.embeddings = OpenAIEmbeddings(model=embedding_model)
-        self.text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=100)
-        self.vector_db = None
-
-    def process_email(self, email_path):
-        """Process an email file and extract key information."""
-        # Load the email
-        loader = UnstructuredEmailLoader(email_path)
-        documents = loader.load()
-
-        # Parse the email content
-        with open(email_path, 'r', errors='ignore') as f:
-            msg = email.message_from_string(f.read())
-
-        # Extract metadata
-        metadata = {
-            "subject": msg.get("subject", ""),
-            "from": msg.get("from", ""),
-            "to": msg.get("to", ""),
-            "date": msg.get("date", ""),
-            "message_id": msg.get("message-id", "")
-        }
-
-        # Extract attachments if any
-        attachments = []
-        for part in msg.walk():
-            if part.get_content_maintype() == 'multipart':
-                continue
-            if part.get('Content-Disposition') is None:
-                continue
-
-            filename = part.get_filename()
-            if filename:
-                # Save the attachment to a temporary file
-                attachment_path = os.path.join("/tmp", filename)
-                with open(attachment_path, 'wb') as f:
-                    f.write(part.get_payload(decode=True))
-                attachments.append(attachment_path)
-
-        # Get the email body
-        body = ""
-        if documents:
-            body = documents[0].page_content
-
-        return {
-            "metadata": metadata,
-            "body": body,
-            "attachments": attachments
-        }
-
-    def classify_document(self, document_content, document_path=None):
-        """Classify the document type and identify key information."""
-        # Define classification prompt
-        classification_prompt = PromptTemplate(
-            input_variables=["document_content", "document_name"],
-            template="""
-            Analyze the following document content and classify it according to these criteria:
-
-            Document Content:
-            {document_content}
-
-            Document Name: {document_name}
-
+CLASSIFICATION_INSTRUCTIONS = """
             Please classify this document and extract key information by answering these questions:
             1. What type of document is this? (e.g., regulatory filing, financial report, compliance document, etc.)
             2. What is the primary subject or purpose of this document?
@@ -89,42 +36,9 @@ class DocumentProcessor:
 
             Return your classification in JSON format.
             """
-        )
 
-        document_name = os.path.basename(document_path) if document_path else "Unknown"
-
-        # Truncate document content if too long
-        max_content_length = 4000  # Limit to avoid token limits
-        truncated_content = document_content[:max_content_length]
-        if len(document_content) > max_content_length:
-            truncated_content += "... [content truncated]"
-
-        # Create and run the classification chain
-        classification_chain = LLMChain(llm=self.llm, prompt=classification_prompt)
-        classification_result = classification_chain.run(
-            document_content=truncated_content,
-            document_name=document_name
-        )
-
-        # Try to parse as JSON, but fallback to raw text if that fails
-        try:
-            import json
-            # Handle case where LLM might wrap JSON in markdown code blocks
-            if "```json" in classification_result:
-                json_str = classification_result.split("```json")[1].split("```")[0].strip()
-                classification_json = json.loads(json_str)
-            else:
-                classification_json = json.loads(classification_result)
-            return classification_json
-        except:
-            return {"raw_classification": classification_result}
-
-    def extract_data_elements(self, document_content):
-        """Extract structured data elements from unstructured document content."""
-        extraction_prompt = PromptTemplate(
-            input_variables=["document_content"],
-            template="""
-            Extract all data elements and their values from the following document content.
+EXTRACTION_INSTRUCTIONS = """
+            Extract all data elements and their values from the document content.
             Focus on identifying:
             1. Numeric data fields and their values
             2. Dates and time periods
@@ -132,9 +46,6 @@ class DocumentProcessor:
             4. Named entities (people, organizations, locations)
             5. Any field-value pairs that appear to be structured data
 
-            Document Content:
-            {document_content}
-
             Return the extracted data elements in JSON format, with field names as keys and the extracted values.
             For each field, include:
             - The field name
@@ -142,44 +53,9 @@ class DocumentProcessor:
             - The data type (string, number, date, boolean, etc.)
             - The confidence level of the extraction (high, medium, low)
             """
-        )
-
-        # Truncate document content if too long
-        max_content_length = 4000  # Limit to avoid token limits
-        truncated_content = document_content[:max_content_length]
-        if len(document_content) > max_content_length:
-            truncated_content += "... [content truncated]"
-
-        # Create and run the extraction chain
-        extraction_chain = LLMChain(llm=self.llm, prompt=extraction_prompt)
-        extraction_result = extraction_chain.run(document_content=truncated_content)
-
-        # Try to parse as JSON, but fallback to raw text if that fails
-        try:
-            import json
-            # Handle case where LLM might wrap JSON in markdown code blocks
-            if "```json" in extraction_result:
-                json_str = extraction_result.split("```json")[1].split("```")[0].strip()
-                extraction_json = json.loads(json_str)
-            else:
-                extraction_json = json.loads(extraction_result)
-            return extraction_json
-        except:
-            return {"raw_extraction": extraction_result}
-
-    def route_document(self, classification, content_summary):
-        """Determine the appropriate routing for a document based on its classification."""
-        routing_prompt = PromptTemplate(
-            input_variables=["classification", "content_summary"],
-            template="""
-            Based on the following document classification and content summary, determine the optimal routing for this document.
-
-            Document Classification:
-            {classification}
-
-            Content Summary:
-            {content_summary}
 
+ROUTING_INSTRUCTIONS = """
+            Based on the document classification and content summary, determine the optimal routing for this document.
             Please specify:
             1. The primary department or team this should be routed to
             2. Any secondary departments that should be notified
@@ -190,34 +66,9 @@ class DocumentProcessor:
 
             Return your routing recommendation in JSON format.
             """
-        )
-
-        # Create and run the routing chain
-        routing_chain = LLMChain(llm=self.llm, prompt=routing_prompt)
-        routing_result = routing_chain.run(
-            classification=str(classification),
-            content_summary=str(content_summary)
-        )
-
-        # Try to parse as JSON, but fallback to raw text if that fails
-        try:
-            import json
-            # Handle case where LLM might wrap JSON in markdown code blocks
-            if "```json" in routing_result:
-                json_str = routing_result.split("```json")[1].split("```")[0].strip()
-                routing_json = json.loads(json_str)
-            else:
-                routing_json = json.loads(routing_result)
-            return routing_json
-        except:
-            return {"raw_routing": routing_result}
 
-    def extract_validation_requirements(self, document_content):
-        """Extract validation requirements from regulatory or compliance documents."""
-        validation_prompt = PromptTemplate(
-            input_variables=["document_content"],
-            template="""
-            Extract all data validation requirements from the following document content.
+VALIDATION_INSTRUCTIONS = """
+            Extract all data validation requirements from the document content.
             Focus on identifying:
             1. Data quality rules
             2. Required fields and mandatory information
@@ -226,99 +77,91 @@ class DocumentProcessor:
             5. Format and structure requirements
             6. Reporting thresholds or limits
 
-            Document Content:
-            {document_content}
-
             Return the extracted validation requirements in JSON format, with each requirement containing:
             - A unique identifier
             - The field or data element it applies to
             - The validation rule in clear language
             - The severity of non-compliance (Critical, High, Medium, Low)
             """
-        )
 
-        # Truncate document content if too long
-        max_content_length = 4000  # Limit to avoid token limits
-        truncated_content = document_content[:max_content_length]
-        if len(document_content) > max_content_length:
-            truncated_content += "... [content truncated]"
+CLASSIFICATION_PROMPT = PromptTemplate(
+    input_variables=["document_content", "document_name"],
+    template="""
+            Analyze the following document content and classify it according to these criteria:
 
-        # Create and run the validation extraction chain
-        validation_chain = LLMChain(llm=self.llm, prompt=validation_prompt)
-        validation_result = validation_chain.run(document_content=truncated_content)
+            Document Content:
+            {document_content}
 
-        # Try to parse as JSON, but fallback to raw text if that fails
-        try:
-            import json
-            # Handle case where LLM might wrap JSON in markdown code blocks
-            if "```json" in validation_result:
-                json_str = validation_result.split("```json")[1].split("```")[0].strip()
-                validation_json = json.loads(json_str)
-            else:
-                validation_json = json.loads(validation_result)
-            return validation_json
-        except:
-            return {"raw_validation": validation_result}
+            Document Name: {document_name}
+            """ + CLASSIFICATION_INSTRUCTIONS
+)
 
-    def process_document_batch(self, document_paths):
-        """Process a batch of documents for triage and routing."""
-        results = []
+EXTRACTION_PROMPT = PromptTemplate(
+    input_variables=["document_content"],
+    template="""
+            Document Content:
+            {document_content}
+            """ + EXTRACTION_INSTRUCTIONS
+)
 
-        for path in document_paths:
-            try:
-                # Determine document type and load it
-                ext = os.path.splitext(path)[1].lower()
-                content = ""
-
-                if ext == ".pdf":
-                    loader = PyPDFLoader(path)
-                    documents = loader.load()
-                    content = "\n".join([doc.page_content for doc in documents])
-                elif ext in [".txt", ".md", ".csv"]:
-                    loader = TextLoader(path)
-                    documents = loader.load()
-                    content = documents[0].page_content if documents else ""
-                elif ext in [".eml", ".msg"]:
-                    email_data = self.process_email(path)
-                    content = email_data["body"]
-                    # Handle email-specific processing
-                    classification = self.classify_document(content, path)
-                    data_elements = self.extract_data_elements(content)
-                    validation_requirements = None
-
-                    # If document appears to be regulatory or compliance-related, extract validation requirements
-                    if classification.get("type", "").lower() in ["regulatory", "compliance", "policy", "procedure"]:
-                        validation_requirements = self.extract_validation_requirements(content)
-
-                    # Determine routing
-                    content_summary = {
-                        "elements": data_elements,
-                        "text_sample": content[:500] + "..." if len(content) > 500 else content
-                    }
-                    routing = self.route_document(classification, content_summary)
-
-                    results.append({
-                        "path": path,
-                        "type": "document",
-                        "classification": classification,
-                        "data_elements": data_elements,
-                        "validation_requirements": validation_requirements,
-                        "routing": routing
-                    })
-            except Exception as e:
-                results.append({
-                    "path": path,
-                    "error": str(e),
-                    "status": "failed"
-                })
+ROUTING_PROMPT = PromptTemplate(
+    input_variables=["classification", "content_summary"],
+    template="""
+            Document Classification:
+            {classification}
 
-        return results
+            Content Summary:
+            {content_summary}
+            """ + ROUTING_INSTRUCTIONS
+)
 
-    def generate_triage_summary(self, batch_results):
-        """Generate a summary of the document batch processing."""
-        summary_prompt = PromptTemplate(
-            input_variables=["batch_results"],
-            template="""
+VALIDATION_PROMPT = PromptTemplate(
+    input_variables=["document_content"],
+    template="""
+            Document Content:
+            {document_content}
+            """ + VALIDATION_INSTRUCTIONS
+)
+
+ANALYSIS_INSTRUCTIONS = """
+            Analyze the document and return a single JSON object with exactly these three keys:
+            - "classification": the document classification described under Classification
+            - "data_elements": the extracted data elements described under Data Elements
+            - "routing": the routing recommendation described under Routing
+
+            Classification:
+            """ + CLASSIFICATION_INSTRUCTIONS + """
+            Data Elements:
+            """ + EXTRACTION_INSTRUCTIONS + """
+            Routing:
+            """ + ROUTING_INSTRUCTIONS
+
+ANALYSIS_PROMPT = PromptTemplate(
+    input_variables=["document_content", "document_name"],
+    template="""
+            Document Content:
+            {document_content}
+
+            Document Name: {document_name}
+            """ + ANALYSIS_INSTRUCTIONS
+)
+
+BATCH_PROMPT = PromptTemplate(
+    input_variables=["count", "instructions", "documents"],
+    template="""
+            For each of the following {count} documents, follow the instructions below and return a JSON list
+            of length {count}, where element N is the JSON result for Document N. Do not skip or merge documents.
+
+            Instructions:
+            {instructions}
+
+            {documents}
+            """
+)
+
+SUMMARY_PROMPT = PromptTemplate(
+    input_variables=["batch_results"],
+    template="""
             Create a summarized triage report based on the following batch processing results:
 
             {batch_results}
@@ -333,11 +176,737 @@ class DocumentProcessor:
 
             Format your response as a structured markdown report with clear sections and bullet points.
             """
+)
+
+CONSOLIDATION_PROMPT = PromptTemplate(
+    input_variables=["requirements"],
+    template="""
+            Below are validation requirements extracted from multiple documents.
+            Please analyze them and:
+            1. Identify duplicate or highly similar requirements
+            2. Consolidate related requirements
+            3. Resolve any conflicts between requirements
+            4. Standardize the format and language
+            5. Assign unique identifiers to each consolidated requirement
+
+            Requirements:
+            {requirements}
+
+            Return the consolidated validation requirements in JSON format, with each requirement containing:
+            - A unique identifier
+            - The field or data element it applies to
+            - The consolidated validation rule in clear language
+            - The source documents (maintain all sources when consolidating)
+            - The severity of non-compliance (using the highest severity from source requirements)
+            """
+)
+
+# File extensions handled by each loader
+_PDF_EXTS = frozenset({".pdf"})
+_TEXT_EXTS = frozenset({".txt", ".md", ".csv"})
+_EMAIL_EXTS = frozenset({".eml", ".msg"})
+_SUPPORTED_EXTS = _PDF_EXTS | _TEXT_EXTS
+
+# Document types that get validation requirements extracted
+_REGULATORY_TYPES = frozenset({"regulatory", "compliance", "policy", "procedure"})
+
+# Matches a ```json fenced block that LLMs often wrap their JSON output in
+_JSON_FENCE_RE = re.compile(r"```json\s*(.*?)\s*```", re.DOTALL)
+
+
+def _extract_json(text):
+    """Parse JSON from an LLM response, unwrapping a ```json code block if present."""
+    match = _JSON_FENCE_RE.search(text)
+    return json.loads(match.group(1) if match else text)
+
+
+# Strips tags from HTML-only email bodies
+_HTML_TAG_RE = re.compile(r"<[^>]+>")
+
+# Collapses whitespace runs when comparing document contents
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def _compact_json(obj):
+    """Serialize prompt input as compact JSON, which costs fewer tokens than a Python repr."""
+    return json.dumps(obj, separators=(",", ":"), default=str)
+
+
+def _document_name(document_path):
+    """Return the file name shown to the LLM for a document."""
+    return os.path.basename(document_path) if document_path else "Unknown"
+
+
+def _pdf_text(path):
+    """Extract the text of a PDF page by page into a single buffer."""
+    buffer = io.StringIO()
+    with fitz.open(path) as pdf:
+        for page in pdf:
+            buffer.write(page.get_text())
+            buffer.write("\n")
+    return buffer.getvalue()
+
+
+def _load_content(path):
+    """Load the text content of a PDF or plain-text document."""
+    ext = os.path.splitext(path)[1].lower()
+
+    if ext in _PDF_EXTS:
+        return _pdf_text(path)
+    elif ext in _TEXT_EXTS:
+        loader = TextLoader(path)
+        documents = loader.load()
+        return documents[0].page_content if documents else ""
+    return ""
+
+
+def _parse_email(email_path, attachment_dir=None):
+    """Parse an email file into its metadata, body and saved attachment paths.
+
+    Attachments are saved to attachment_dir, or to a new temporary directory owned by the caller if it is None.
+    """
+    # Parse the email content
+    with open(email_path, 'rb') as f:
+        msg = email.message_from_binary_file(f, policy=email.policy.default)
+
+    # Extract metadata
+    metadata = {
+        "subject": str(msg.get("subject", "")),
+        "from": str(msg.get("from", "")),
+        "to": str(msg.get("to", "")),
+        "date": str(msg.get("date", "")),
+        "message_id": str(msg.get("message-id", ""))
+    }
+
+    # Collect the body and attachments in a single walk over the MIME tree
+    attachments = []
+    text_parts = []
+    html_parts = []
+    for part in msg.walk():
+        if part.get_content_maintype() == 'multipart':
+            continue
+
+        filename = part.get_filename()
+        if filename and part.get('Content-Disposition') is not None:
+            # Save the attachment to a private temporary directory under a content-addressed name,
+            # so attachments with the same name never collide and filenames cannot escape the directory
+            payload = part.get_payload(decode=True) or b""
+            if attachment_dir is None:
+                attachment_dir = tempfile.mkdtemp(prefix="docdash_")
+            digest = hashlib.sha1(payload).hexdigest()[:16]
+            attachment_path = os.path.join(attachment_dir, f"{digest}_{os.path.basename(filename)}")
+            if attachment_path in attachments:
+                continue
+
+            fd = os.open(attachment_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o600)
+            try:
+                view = memoryview(payload)
+                while view:
+                    view = view[os.write(fd, view):]
+            finally:
+                os.close(fd)
+            attachments.append(attachment_path)
+        elif not filename and part.get_content_type() == "text/plain":
+            text_parts.append(part.get_content())
+        elif not filename and part.get_content_type() == "text/html":
+            html_parts.append(part.get_content())
+
+    # Get the email body, falling back to the HTML part with tags stripped
+    body = "\n".join(text_parts).strip()
+    if not body and html_parts:
+        body = _HTML_TAG_RE.sub(" ", "\n".join(html_parts)).strip()
+
+    return {
+        "metadata": metadata,
+        "body": body,
+        "attachments": attachments
+    }
+
+
+def _load_document(path):
+    """Load a document, or an email with its attachments, ready for the LLM stages.
+
+    Runs in a worker process, so failures are returned as an error entry rather than raised.
+    """
+    try:
+        ext = os.path.splitext(path)[1].lower()
+
+        if ext in _EMAIL_EXTS:
+            # The attachment files are only needed until their content is loaded, so remove them afterwards
+            with tempfile.TemporaryDirectory(prefix="docdash_") as attachment_dir:
+                email_data = _parse_email(path, attachment_dir)
+
+                # Process attachments if any, skipping images, archives and other unsupported formats
+                attachments = []
+                for attachment_path in email_data["attachments"]:
+                    if os.path.splitext(attachment_path)[1].lower() not in _SUPPORTED_EXTS:
+                        continue
+                    att_content = _load_content(attachment_path)
+                    if att_content:
+                        attachments.append({"path": attachment_path, "content": att_content})
+
+            return {"path": path, "content": email_data["body"], "email": email_data, "attachments": attachments}
+
+        return {"path": path, "content": _load_content(path)}
+    except Exception as e:
+        return {"path": path, "error": str(e)}
+
+
+# Stages whose results are reused for near-duplicate documents, keyed on the content embedding.
+# Only the classification qualifies, served by classify_document and aclassify_document: the batch pipeline's
+# analysis holds the data elements extracted from one document, which must never be handed to another
+# document, so it stays on the exact content cache
+SEMANTIC_CACHE_STAGES = ("classify",)
+
+
+def cached_llm(stage):
+    """Cache the parsed result of a DocumentProcessor LLM method by stage, model and input content.
+
+    For SEMANTIC_CACHE_STAGES, a miss on the exact content also checks for a stored result of a
+    near-duplicate document before calling the LLM. The document content is the first argument.
+    """
+    semantic = stage in SEMANTIC_CACHE_STAGES
+
+    def decorator(method):
+        signature = inspect.signature(method)
+
+        def cache_key(self, *args, **kwargs):
+            """Build the cache key of a call, keeping only the file name of the document path.
+
+            Attachments are saved to a new temporary directory on every run, so their full paths never repeat.
+            """
+            arguments = signature.bind(self, *args, **kwargs).arguments
+            arguments.pop("self")
+            document_name = _document_name(arguments.pop("document_path", None))
+            return self._cache_key(stage, *arguments.values(), document_name=document_name)
+
+        if asyncio.iscoroutinefunction(method):
+            @functools.wraps(method)
+            async def async_wrapper(self, *args, **kwargs):
+                key = cache_key(self, *args, **kwargs)
+                if key in self._llm_cache:
+                    return copy.deepcopy(self._llm_cache[key])
+
+                vector = None
+                if semantic and self.semantic_threshold:
+                    vector = await self.embeddings.aembed_query(self._truncate(args[0]))
+                    similar = self._semantic_lookup(stage, vector)
+                    if similar is not None:
+                        return similar
+
+                result = await method(self, *args, **kwargs)
+                self._store_cached(key, result, stage, vector)
+                return result
+            async_wrapper.cache_key = cache_key
+            return async_wrapper
+
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            key = cache_key(self, *args, **kwargs)
+            if key in self._llm_cache:
+                return copy.deepcopy(self._llm_cache[key])
+
+            vector = None
+            if semantic and self.semantic_threshold:
+                vector = self.embeddings.embed_query(self._truncate(args[0]))
+                similar = self._semantic_lookup(stage, vector)
+                if similar is not None:
+                    return similar
+
+            result = method(self, *args, **kwargs)
+            self._store_cached(key, result, stage, vector)
+            return result
+        wrapper.cache_key = cache_key
+        return wrapper
+    return decorator
+
+
+class DocumentProcessor:
+    def __init__(self, model_name="gpt-4", embedding_model="text-embedding-ada-002", max_batch=6,
+                 max_concurrency=16, max_prompt_tokens=6000, max_workers=None,
+                 semantic_threshold=0.97):
+        """Initialize the document processor with specified LLM and embedding models.
+
+        max_batch caps how many documents share a single batched prompt and max_concurrency
+        caps the number of LLM requests in flight at once. max_prompt_tokens is the token budget
+        for document content in a single prompt. max_workers sizes the process pool used to load
+        documents and defaults to the number of CPUs. Documents whose embeddings have a cosine
+        similarity of at least semantic_threshold reuse each other's classification; pass None to
+        disable the semantic cache.
+        """
+        self.llm = OpenAI(model_name=model_name, streaming=True)
+        self.embeddings = OpenAIEmbeddings(model=embedding_model)
+        self.text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=100)
+        self.vector_db = None
+        try:
+            self._enc = tiktoken.encoding_for_model(model_name)
+        except KeyError:
+            self._enc = tiktoken.get_encoding("cl100k_base")
+        self.max_batch = max_batch
+        self.max_prompt_tokens = max_prompt_tokens
+        self.max_concurrency = max_concurrency
+        self.max_workers = max_workers or os.cpu_count()
+        self.semantic_threshold = semantic_threshold
+        self._llm_cache = {}
+        self._semantic_cache = {}
+
+        # Build each chain once and reuse it across documents
+        self._classification_chain = LLMChain(llm=self.llm, prompt=CLASSIFICATION_PROMPT)
+        self._extraction_chain = LLMChain(llm=self.llm, prompt=EXTRACTION_PROMPT)
+        self._routing_chain = LLMChain(llm=self.llm, prompt=ROUTING_PROMPT)
+        self._validation_chain = LLMChain(llm=self.llm, prompt=VALIDATION_PROMPT)
+        self._analysis_chain = LLMChain(llm=self.llm, prompt=ANALYSIS_PROMPT)
+        self._batch_chain = LLMChain(llm=self.llm, prompt=BATCH_PROMPT)
+        self._summary_chain = LLMChain(llm=self.llm, prompt=SUMMARY_PROMPT)
+        self._consolidation_chain = LLMChain(llm=self.llm, prompt=CONSOLIDATION_PROMPT)
+
+    def process_email(self, email_path):
+        """Process an email file and extract key information."""
+        return _parse_email(email_path)
+
+    @cached_llm(stage="classify")
+    def classify_document(self, document_content, document_path=None):
+        """Classify the document type and identify key information."""
+        document_name = _document_name(document_path)
+
+        classification_result = self._run_json_chain(
+            self._classification_chain,
+            document_content=self._truncate(document_content),
+            document_name=document_name
         )
 
-        # Create and run the summary chain
-        summary_chain = LLMChain(llm=self.llm, prompt=summary_prompt)
-        summary_result = summary_chain.run(batch_results=str(batch_results))
+        return self._parse_json_result(classification_result, "raw_classification")
+
+    @cached_llm(stage="classify")
+    async def aclassify_document(self, document_content, document_path=None):
+        """Asynchronously classify the document type and identify key information."""
+        document_name = _document_name(document_path)
+
+        classification_result = await self._arun_json_chain(
+            self._classification_chain,
+            document_content=self._truncate(document_content),
+            document_name=document_name
+        )
+
+        return self._parse_json_result(classification_result, "raw_classification")
+
+    @cached_llm(stage="extract")
+    def extract_data_elements(self, document_content):
+        """Extract structured data elements from unstructured document content."""
+        extraction_result = self._run_json_chain(
+            self._extraction_chain,
+            document_content=self._truncate(document_content)
+        )
+
+        return self._parse_json_result(extraction_result, "raw_extraction")
+
+    @cached_llm(stage="extract")
+    async def aextract_data_elements(self, document_content):
+        """Asynchronously extract structured data elements from unstructured document content."""
+        extraction_result = await self._arun_json_chain(
+            self._extraction_chain,
+            document_content=self._truncate(document_content)
+        )
+
+        return self._parse_json_result(extraction_result, "raw_extraction")
+
+    @cached_llm(stage="route")
+    def route_document(self, classification, content_summary):
+        """Determine the appropriate routing for a document based on its classification."""
+        routing_result = self._run_json_chain(
+            self._routing_chain,
+            classification=_compact_json(classification),
+            content_summary=_compact_json(content_summary)
+        )
+
+        return self._parse_json_result(routing_result, "raw_routing")
+
+    @cached_llm(stage="route")
+    async def aroute_document(self, classification, content_summary):
+        """Asynchronously determine the appropriate routing for a document based on its classification."""
+        routing_result = await self._arun_json_chain(
+            self._routing_chain,
+            classification=_compact_json(classification),
+            content_summary=_compact_json(content_summary)
+        )
+
+        return self._parse_json_result(routing_result, "raw_routing")
+
+    @cached_llm(stage="validate")
+    def extract_validation_requirements(self, document_content):
+        """Extract validation requirements from regulatory or compliance documents."""
+        validation_result = self._run_json_chain(
+            self._validation_chain,
+            document_content=self._truncate(document_content)
+        )
+
+        return self._parse_json_result(validation_result, "raw_validation")
+
+    @cached_llm(stage="validate")
+    async def aextract_validation_requirements(self, document_content):
+        """Asynchronously extract validation requirements from regulatory or compliance documents."""
+        validation_result = await self._arun_json_chain(
+            self._validation_chain,
+            document_content=self._truncate(document_content)
+        )
+
+        return self._parse_json_result(validation_result, "raw_validation")
+
+    @cached_llm(stage="analyze")
+    def analyze_document(self, document_content, document_path=None):
+        """Classify, extract data elements from and route a document with a single LLM call."""
+        document_name = _document_name(document_path)
+
+        analysis_result = self._run_json_chain(
+            self._analysis_chain,
+            document_content=self._truncate(document_content),
+            document_name=document_name
+        )
+
+        return self._parse_json_result(analysis_result, "raw_analysis")
+
+    @cached_llm(stage="analyze")
+    async def aanalyze_document(self, document_content, document_path=None):
+        """Asynchronously classify, extract data elements from and route a document with a single LLM call."""
+        document_name = _document_name(document_path)
+
+        analysis_result = await self._arun_json_chain(
+            self._analysis_chain,
+            document_content=self._truncate(document_content),
+            document_name=document_name
+        )
+
+        return self._parse_json_result(analysis_result, "raw_analysis")
+
+    def process_document_batch(self, document_paths):
+        """Process a batch of documents for triage and routing."""
+        return asyncio.run(self.process_document_batch_async(document_paths))
+
+    async def process_document_batch_async(self, document_paths):
+        """Process a batch of documents for triage and routing, overlapping the LLM calls."""
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        results = [None] * len(document_paths)
+        documents = []
+        emails = []
+        attachments = []
+
+        # Load and parse every document up front in worker processes, since PDF parsing is CPU-bound
+        loaded = []
+        if document_paths:
+            loop = asyncio.get_running_loop()
+            with ProcessPoolExecutor(max_workers=self.max_workers) as executor:
+                loaded = await asyncio.gather(*[
+                    loop.run_in_executor(executor, _load_document, path) for path in document_paths
+                ])
+
+        # Coalesce duplicates, such as repeated forwards of the same email, into a single LLM pass
+        seen = {}
+        duplicates = {}
+
+        for index, document in enumerate(loaded):
+            document["index"] = index
+            if "error" in document:
+                results[index] = {"path": document["path"], "error": document["error"], "status": "failed"}
+                continue
+
+            key = self._content_key(document)
+            if key in seen:
+                duplicates[index] = seen[key]
+                continue
+            seen[key] = index
+
+            if "email" in document:
+                emails.append(document)
+                for attachment in document.pop("attachments"):
+                    attachments.append(dict(attachment, index=index))
+            elif document["content"]:
+                documents.append(document)
+
+        # Classify, extract data elements and route every document, email body and attachment
+        # with one multi-task prompt per document, batched across documents
+        items = documents + emails + attachments
+        for item in items:
+            item["truncated"] = self._truncate(item["content"])
+        analyses = await self._run_batched_stage(
+            "analyze",
+            [f"Document Name: {_document_name(item['path'])}\n{item['truncated']}" for item in items],
+            ANALYSIS_INSTRUCTIONS,
+            self.aanalyze_document,
+            [(item["content"], item["path"]) for item in items],
+            semaphore
+        )
+        for item, analysis in zip(items, analyses):
+            item.update(self._split_analysis(analysis))
+
+        # If a document appears to be regulatory or compliance-related, extract validation requirements
+        regulatory = [
+            item for item in documents
+            if isinstance(item["classification"], dict)
+            and str(item["classification"].get("type", "")).lower() in _REGULATORY_TYPES
+        ]
+        validation_requirements = await self._run_batched_stage(
+            "validate",
+            [item["truncated"] for item in regulatory],
+            VALIDATION_INSTRUCTIONS,
+            self.aextract_validation_requirements,
+            [(item["content"],) for item in regulatory],
+            semaphore
+        )
+        for item, requirements in zip(regulatory, validation_requirements):
+            item["validation_requirements"] = requirements
+
+        # Include email metadata and attachment results
+        for item in emails:
+            item["attachments"] = [
+                {
+                    "path": attachment["path"],
+                    "classification": attachment["classification"],
+                    "data_elements": attachment["data_elements"]
+                }
+                for attachment in attachments
+                if attachment["index"] == item["index"] and not self._failed(attachment)
+            ]
+
+        for item in documents + emails:
+            error = self._failed(item)
+            if error:
+                results[item["index"]] = {"path": item["path"], "error": str(error), "status": "failed"}
+            elif "email" in item:
+                results[item["index"]] = {
+                    "path": item["path"],
+                    "type": "email",
+                    "metadata": item["email"]["metadata"],
+                    "classification": item["classification"],
+                    "data_elements": item["data_elements"],
+                    "attachments": item["attachments"]
+                }
+            else:
+                results[item["index"]] = {
+                    "path": item["path"],
+                    "type": "document",
+                    "classification": item["classification"],
+                    "data_elements": item["data_elements"],
+                    "validation_requirements": item.get("validation_requirements"),
+                    "routing": item["routing"]
+                }
+
+        # Broadcast the results of each processed document to its duplicates
+        for index, original in duplicates.items():
+            if results[original] is None:
+                continue
+            result = copy.deepcopy(results[original])
+            result["path"] = loaded[index]["path"]
+            if "email" in loaded[index] and "metadata" in result:
+                result["metadata"] = loaded[index]["email"]["metadata"]
+                own_paths = {os.path.basename(path): path for path in loaded[index]["email"]["attachments"]}
+                for attachment in result["attachments"]:
+                    attachment["path"] = own_paths.get(os.path.basename(attachment["path"]), attachment["path"])
+            results[index] = result
+
+        return [result for result in results if result is not None]
+
+    def _count_tokens(self, text):
+        """Count the model tokens in a piece of text."""
+        return len(self._enc.encode(text, disallowed_special=()))
+
+    def _truncate(self, document_content, budget=None):
+        """Truncate document content to a token budget so prompts stay within the model's context window."""
+        budget = budget or self.max_prompt_tokens
+        tokens = self._enc.encode(document_content, disallowed_special=())
+        if len(tokens) <= budget:
+            return document_content
+        return self._enc.decode(tokens[:budget]) + "... [content truncated]"
+
+    @staticmethod
+    def _content_key(document):
+        """Hash a loaded document's whitespace-normalized content, plus its attachments for emails."""
+        content = _WHITESPACE_RE.sub(" ", document["content"]).strip()
+        if "email" in document:
+            attachment_names = sorted(os.path.basename(path) for path in document["email"]["attachments"])
+            content = "email|" + content + "|" + "|".join(attachment_names)
+        return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _split_analysis(analysis):
+        """Split a combined analysis result into its classification, data elements and routing."""
+        if isinstance(analysis, Exception):
+            return {"classification": analysis, "data_elements": analysis, "routing": analysis}
+        if not isinstance(analysis, dict) or "classification" not in analysis:
+            # Unstructured response, keep it as the classification so it is still reported
+            return {"classification": analysis, "data_elements": {}, "routing": {}}
+        return {
+            "classification": analysis["classification"],
+            "data_elements": analysis.get("data_elements", {}),
+            "routing": analysis.get("routing", {})
+        }
+
+    @staticmethod
+    def _failed(item):
+        """Return the first LLM stage error recorded for a batch item, if any."""
+        for key in ["classification", "data_elements", "validation_requirements", "routing"]:
+            if isinstance(item.get(key), Exception):
+                return item[key]
+        return None
+
+    async def _run_batched_stage(self, stage, prompts, shared_template, single_call, call_args, semaphore):
+        """Run one LLM stage over a batch, falling back to per-document calls for unparseable batches.
+
+        Cached results are reused and only the remaining documents are sent, in sub-batches that
+        run concurrently. call_args holds the single_call arguments for each prompt.
+        """
+        keys = [single_call.cache_key(self, *args) for args in call_args]
+        results = [copy.deepcopy(self._llm_cache.get(key)) for key in keys]
+        pending = [i for i, key in enumerate(keys) if key not in self._llm_cache]
+
+        async def run_sub_batch(indices):
+            batch_results = None
+            try:
+                async with semaphore:
+                    batch_results = await self._batch_llm_json([prompts[i] for i in indices], shared_template)
+            except Exception:
+                pass
+
+            if batch_results is None:
+                # single_call is cached itself, so only batched results need storing here
+                batch_results = await asyncio.gather(
+                    *[self._limited(semaphore, single_call, call_args[i]) for i in indices],
+                    return_exceptions=True
+                )
+            else:
+                for i, result in zip(indices, batch_results):
+                    self._store_cached(keys[i], result)
+
+            for i, result in zip(indices, batch_results):
+                results[i] = result
+
+        await asyncio.gather(*[run_sub_batch(indices) for indices in self._sub_batches(pending, prompts)])
+        return results
+
+    def _sub_batches(self, indices, prompts):
+        """Group prompts into sub-batches bounded by max_batch and the prompt token budget."""
+        sub_batches = []
+        current = []
+        used_tokens = 0
+
+        for i in indices:
+            tokens = self._count_tokens(prompts[i])
+            if current and (len(current) >= self.max_batch or used_tokens + tokens > self.max_prompt_tokens):
+                sub_batches.append(current)
+                current = []
+                used_tokens = 0
+            current.append(i)
+            used_tokens += tokens
+
+        if current:
+            sub_batches.append(current)
+        return sub_batches
+
+    @staticmethod
+    async def _limited(semaphore, call, args):
+        """Await a single LLM call while holding the concurrency semaphore."""
+        async with semaphore:
+            return await call(*args)
+
+    async def _batch_llm_json(self, prompts, shared_template):
+        """Answer the same instructions for several documents with a single LLM call.
+
+        Returns one parsed JSON result per prompt, or None if the response is not a JSON list
+        of the expected length.
+        """
+        if not prompts:
+            return []
+
+        documents = "\n\n".join(f"Document {i}:\n{prompt}" for i, prompt in enumerate(prompts, 1))
+
+        batch_result = await self._arun_json_chain(
+            self._batch_chain,
+            count=len(prompts),
+            instructions=shared_template,
+            documents=documents
+        )
+
+        batch_json = self._parse_json_result(batch_result, "raw_batch")
+        if not isinstance(batch_json, list) or len(batch_json) != len(prompts):
+            return None
+        return batch_json
+
+    @staticmethod
+    def _run_json_chain(chain, **inputs):
+        """Run a chain whose output is JSON, stopping the stream as soon as the JSON is complete."""
+        collector = JsonStreamCollector(strict=False)
+        try:
+            return chain.run(callbacks=[collector], **inputs)
+        except JsonComplete:
+            return collector.text()
+
+    @staticmethod
+    async def _arun_json_chain(chain, **inputs):
+        """Asynchronously run a chain whose output is JSON, stopping the stream as soon as the JSON is complete."""
+        collector = JsonStreamCollector(strict=False)
+        try:
+            return await chain.arun(callbacks=[collector], **inputs)
+        except JsonComplete:
+            return collector.text()
+
+    def _cache_key(self, stage, *args, document_name="Unknown"):
+        """Build the LLM cache key for a stage from the model name, the document name and the call's input content."""
+        content = json.dumps(args, sort_keys=True, default=str)
+        return hashlib.sha256(
+            f"{stage}|{self.llm.model_name}|{document_name}|{content}".encode("utf-8")
+        ).hexdigest()
+
+    def _store_cached(self, key, result, stage=None, vector=None):
+        """Cache a parsed LLM result, skipping raw-text fallbacks so they are retried next time.
+
+        When the document embedding is given, the result is also added to the semantic cache.
+        The cache holds its own copy, and cache hits return copies, so callers may modify results freely.
+        """
+        if isinstance(result, dict) and any(k.startswith("raw_") for k in result):
+            return
+        result = copy.deepcopy(result)
+        self._llm_cache[key] = result
+
+        if vector is not None:
+            vectors, results = self._semantic_cache.get(stage, (np.empty((0, len(vector))), []))
+            vector = np.asarray(vector, dtype=float)
+            vector = vector / np.linalg.norm(vector)
+            self._semantic_cache[stage] = (np.vstack([vectors, vector]), results + [result])
+
+    def _semantic_lookup(self, stage, vector):
+        """Return the stored result of the most similar earlier document if it clears semantic_threshold."""
+        if stage not in self._semantic_cache:
+            return None
+
+        vectors, results = self._semantic_cache[stage]
+        vector = np.asarray(vector, dtype=float)
+        # Stored vectors are normalized, so the inner product is the cosine similarity
+        similarities = vectors @ (vector / np.linalg.norm(vector))
+        best = int(np.argmax(similarities))
+        return copy.deepcopy(results[best]) if similarities[best] >= self.semantic_threshold else None
+
+    def load_cache(self, path):
+        """Load previously saved LLM results into the cache."""
+        if os.path.exists(path):
+            with open(path, 'r') as f:
+                self._llm_cache.update(json.load(f))
+
+    def save_cache(self, path):
+        """Save the LLM result cache so later runs can reuse it."""
+        with open(path, 'w') as f:
+            json.dump(self._llm_cache, f)
+
+    @staticmethod
+    def _parse_json_result(result, raw_key):
+        """Parse an LLM response as JSON, falling back to the raw text under raw_key."""
+        try:
+            return _extract_json(result)
+        except Exception:
+            return {raw_key: result}
+
+    def generate_triage_summary(self, batch_results):
+        """Generate a summary of the document batch processing."""
+        # Run the summary chain
+        summary_result = self._summary_chain.run(batch_results=_compact_json(batch_results))
 
         return summary_result
 
@@ -362,87 +931,40 @@ class DocumentProcessor:
         if not all_requirements:
             return []
 
-        # Use LLM to consolidate and remove duplicates
-        consolidation_prompt = PromptTemplate(
-            input_variables=["requirements"],
-            template="""
-            Below are validation requirements extracted from multiple documents.
-            Please analyze them and:
-            1. Identify duplicate or highly similar requirements
-            2. Consolidate related requirements
-            3. Resolve any conflicts between requirements
-            4. Standardize the format and language
-            5. Assign unique identifiers to each consolidated requirement
+        # Small sets without duplicates need no consolidation, so skip the LLM call for them
+        if len(all_requirements) == 1:
+            return all_requirements
+        if len(all_requirements) <= 5 and not self._has_similar_requirements(all_requirements):
+            return all_requirements
 
-            Requirements:
-            {requirements}
-
-            Return the consolidated validation requirements in JSON format, with each requirement containing:
-            - A unique identifier
-            - The field or data element it applies to
-            - The consolidated validation rule in clear language
-            - The source documents (maintain all sources when consolidating)
-            - The severity of non-compliance (using the highest severity from source requirements)
-            """
+        # Use LLM to consolidate and remove duplicates
+        consolidation_result = self._run_json_chain(
+            self._consolidation_chain,
+            requirements=_compact_json(all_requirements)
         )
 
-        # Create and run the consolidation chain
-        consolidation_chain = LLMChain(llm=self.llm, prompt=consolidation_prompt)
-        consolidation_result = consolidation_chain.run(requirements=str(all_requirements))
-
         # Try to parse as JSON, but fallback to raw text if that fails
-        try:
-            import json
-            # Handle case where LLM might wrap JSON in markdown code blocks
-            if "```json" in consolidation_result:
-                json_str = consolidation_result.split("```json")[1].split("```")[0].strip()
-                consolidated_json = json.loads(json_str)
-            else:
-                consolidated_json = json.loads(consolidation_result)
-            return consolidated_json
-        except:
-            return {"raw_consolidation": consolidation_result}
-
-)
-
-# Process attachments if any
-attachment_results = []
-for attachment_path in email_data["attachments"]:
-    att_ext = os.path.splitext(attachment_path)[1].lower()
-att_content = ""
-
-if att_ext == ".pdf":
-    att_loader = PyPDFLoader(attachment_path)
-att_documents = att_loader.load()
-att_content = "\n".join([doc.page_content for doc in att_documents])
-elif att_ext in [".txt", ".md", ".csv"]:
-att_loader = TextLoader(attachment_path)
-att_documents = att_loader.load()
-att_content = att_documents[0].page_content if att_documents else ""
-
-if att_content:
-    att_classification = self.classify_document(att_content, attachment_path)
-att_data_elements = self.extract_data_elements(att_content)
-
-attachment_results.append({
-    "path": attachment_path,
-    "classification": att_classification,
-    "data_elements": att_data_elements
-})
-
-# Include email metadata and attachment results
-results.append({
-    "path": path,
-    "type": "email",
-    "metadata": email_data["metadata"],
-    "classification": classification,
-    "data_elements": data_elements,
-    "attachments": attachment_results
-})
-
-continue  # Skip the rest of the loop for emails
-
-# For non-email documents
-if content:
-    classification = self.classify_document(content, path)
-    data_elements = self.extract_data_elements(content)
\ No newline at end of file
+        return self._parse_json_result(consolidation_result, "raw_consolidation")
+
+    @staticmethod
+    def _has_similar_requirements(requirements):
+        """Check whether any two requirements look like duplicates of each other.
+
+        Requirements whose field or rule text cannot be identified are treated as possible duplicates.
+        """
+        def field_and_rule(req):
+            field = next((req[k] for k in ("field", "data_element", "element") if k in req), None)
+            rule = next((req[k] for k in ("rule", "validation_rule", "description") if k in req), None)
+            return field, rule
+
+        pairs = [field_and_rule(req) for req in requirements]
+        if any(field is None or rule is None for field, rule in pairs):
+            return True
+
+        for i, (field, rule) in enumerate(pairs):
+            for other_field, other_rule in pairs[i + 1:]:
+                if str(field).lower() != str(other_field).lower():
+                    continue
+                if difflib.SequenceMatcher(None, str(rule).lower(), str(other_rule).lower()).ratio() > 0.9:
+                    return True
+        return False
@@ -1,18 +1,377 @@
-import pandas as pd
+import re
 import json
+import numpy as np
+import pandas as pd
+import orjson
+import time
+import asyncio
+import hashlib
+import types
+import openai
+import tiktoken
+from tenacity import retry, retry_if_exception_type, stop_after_attempt, wait_exponential
 from langchain.llms import OpenAI
 from langchain.prompts import PromptTemplate
 import logging
+from DocDash.common.llm import (
+    LLM_CACHE_PATH, JsonComplete, JsonStreamCollector, sqlite_llm_cache, update_llm_cache
+)
+from DocDash.common.serialization import ORJSON_OPTIONS
+
+
+# Fenced JSON and Python blocks in LLM responses; the language label is optional
+_JSON_FENCE_RE = re.compile(r"```(?:json)?\s*(.*?)```", re.DOTALL)
+_PYTHON_FENCE_RE = re.compile(r"```(?:python)?\s*(.*?)```", re.DOTALL)
+
+# Retry transient OpenAI failures with exponential backoff; other errors are raised immediately
+llm_retry = retry(
+    retry=retry_if_exception_type((
+        openai.RateLimitError,
+        openai.APIConnectionError,
+        openai.APITimeoutError,
+        openai.InternalServerError
+    )),
+    wait=wait_exponential(multiplier=1, max=30),
+    stop=stop_after_attempt(5),
+    reraise=True
+)
+
+
+def _dumps(obj, option=0):
+    """Serialize an object to a compact JSON string, falling back to str() for unsupported types."""
+    return orjson.dumps(obj, default=str, option=ORJSON_OPTIONS | option).decode("utf-8")
+
+
+BATCH_REMEDIATION_PROMPT = PromptTemplate(
+    input_variables=["batch"],
+    template="""
+            Generate a remediation plan for each of the following validation issues.
+            Each issue lists the rule ID, rule type, rule description, severity and example records that failed the validation,
+            plus a rule_result_summary with the total number of failed records and a sample of their IDs:
+
+            {batch}
+
+            For each issue, please provide:
+            1. A concise explanation of why the data likely failed this validation
+            2. Step-by-step remediation actions that could be taken
+            3. Whether this could be remediated automatically (true/false)
+            4. If automatic remediation is possible, provide pseudocode for the fix
+            5. A suggested explanation for auditors about this issue
+
+            Format your response as a JSON array with one object per issue, with the following structure:
+            ```
+            [
+                {{
+                    "rule_id": "The rule ID of the issue",
+                    "explanation": "Clear explanation of the issue",
+                    "remediation_steps": ["Step 1", "Step 2", "..."],
+                    "can_automate": true/false,
+                    "automation_code": "Pseudocode or actual code for fixing the issue",
+                    "auditor_explanation": "Explanation suitable for auditors"
+                }}
+            ]
+            ```
+            """
+)
+
+REMEDIATION_PROMPT = PromptTemplate(
+    input_variables=["rule_id", "rule_info", "failed_data", "rule_result"],
+    template="""
+            Generate a remediation plan for the following validation issue:
+
+            Rule ID: {rule_id}
+            Rule Type: {rule_info[type]}
+            Rule Description: {rule_info[description]}
+            Severity: {rule_info[severity]}
+
+            The validation failed on these example records:
+            {failed_data}
+
+            Validation result, with the total number of failed records and a sample of their IDs:
+            {rule_result}
+
+            Based on this information, please provide:
+            1. A concise explanation of why the data likely failed this validation
+            2. Step-by-step remediation actions that could be taken
+            3. Whether this could be remediated automatically (true/false)
+            4. If automatic remediation is possible, provide pseudocode for the fix
+            5. A suggested explanation for auditors about this issue
+
+            Format your response as a JSON object with the following structure:
+            ```
+            {{
+                "explanation": "Clear explanation of the issue",
+                "remediation_steps": ["Step 1", "Step 2", "..."],
+                "can_automate": true/false,
+                "automation_code": "Pseudocode or actual code for fixing the issue",
+                "auditor_explanation": "Explanation suitable for auditors"
+            }}
+            ```
+            """
+)
+
+AUTOMATION_PROMPT = PromptTemplate(
+    input_variables=["automation_code"],
+    template="""
+        Convert the following remediation pseudocode to executable Python code 
+        that can be applied to a pandas DataFrame named 'df':
+
+        {automation_code}
+
+        The code should:
+        1. Accept a pandas DataFrame as input
+        2. Apply the remediation logic
+        3. Return the modified DataFrame
+        4. Include appropriate error handling
+
+        Return only the Python function definition.
+        """
+)
+
+AUDIT_REPORT_PROMPT = PromptTemplate(
+    input_variables=["report_data"],
+    template="""
+        Generate a comprehensive audit report based on the following validation and remediation information:
+
+        {report_data}
+
+        The report should include:
+        1. An executive summary
+        2. Validation results overview
+        3. Remediation actions taken
+        4. Issues requiring manual review
+        5. Recommendations for process improvement
+
+        Format the report as a well-structured markdown document with appropriate headings, lists, and formatting.
+        """
+)
+
+
+class RateLimiter:
+    """Cap concurrent LLM requests and pace them to requests-per-minute and tokens-per-minute limits.
+
+    The per-minute limits are token buckets that refill continuously; None disables a limit.
+    """
+
+    def __init__(self, max_concurrency, requests_per_minute=None, tokens_per_minute=None):
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.available_requests = requests_per_minute or 0
+        self.available_tokens = tokens_per_minute or 0
+        self.last_update = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    def _refill(self):
+        """Add the request and token capacity that has accrued since the last update."""
+        now = time.monotonic()
+        elapsed = now - self.last_update
+        self.last_update = now
+
+        if self.requests_per_minute:
+            self.available_requests = min(
+                self.requests_per_minute,
+                self.available_requests + elapsed * self.requests_per_minute / 60
+            )
+        if self.tokens_per_minute:
+            self.available_tokens = min(
+                self.tokens_per_minute,
+                self.available_tokens + elapsed * self.tokens_per_minute / 60
+            )
+
+    async def wait(self, tokens):
+        """Wait until there is capacity for one request of the given token count, then consume it."""
+        # A request larger than the whole per-minute budget only has to wait for a full bucket
+        if self.tokens_per_minute:
+            tokens = min(tokens, self.tokens_per_minute)
+
+        async with self.lock:
+            while True:
+                self._refill()
+                has_request = not self.requests_per_minute or self.available_requests >= 1
+                has_tokens = not self.tokens_per_minute or self.available_tokens >= tokens
+                if has_request and has_tokens:
+                    if self.requests_per_minute:
+                        self.available_requests -= 1
+                    if self.tokens_per_minute:
+                        self.available_tokens -= tokens
+                    return
+                await asyncio.sleep(0.1)
+
+
+class BatchLLMClient:
+    """Run prompts through the OpenAI Batch API.
+
+    Batch requests cost half as much as synchronous calls and have their own rate limits, but may
+    take up to the 24 hour completion window to finish.
+    """
+
+    def __init__(self, model_name="gpt-4", temperature=0, poll_interval=30):
+        self.client = openai.OpenAI()
+        self.model_name = model_name
+        self.temperature = temperature
+        self.poll_interval = poll_interval
+        self.logger = logging.getLogger(__name__)
+
+    def submit(self, prompts):
+        """Submit the prompts as one batch and wait for it to finish.
+
+        Returns the response text for each prompt, in order, or None for prompts whose request failed.
+        """
+        responses = [None] * len(prompts)
+        if not prompts:
+            return responses
+
+        # Serialize the prompts to the batch input format, using the prompt position as the custom ID
+        lines = [
+            orjson.dumps({
+                "custom_id": str(i),
+                "method": "POST",
+                "url": "/v1/chat/completions",
+                "body": {
+                    "model": self.model_name,
+                    "temperature": self.temperature,
+                    "messages": [{"role": "user", "content": prompt}]
+                }
+            })
+            for i, prompt in enumerate(prompts)
+        ]
+        batch_input = self.client.files.create(
+            file=("batch_input.jsonl", b"\n".join(lines)),
+            purpose="batch"
+        )
+        batch = self.client.batches.create(
+            input_file_id=batch_input.id,
+            endpoint="/v1/chat/completions",
+            completion_window="24h"
+        )
+        self.logger.info(f"Submitted batch {batch.id} with {len(prompts)} requests")
+
+        # Poll until the batch reaches a terminal state
+        while batch.status not in ("completed", "failed", "expired", "cancelled"):
+            time.sleep(self.poll_interval)
+            batch = self.client.batches.retrieve(batch.id)
+
+        if batch.status != "completed":
+            self.logger.warning(f"Batch {batch.id} ended with status {batch.status}")
+        if not batch.output_file_id:
+            return responses
+
+        # Map each response back to its prompt
+        output = self.client.files.content(batch.output_file_id).text
+        for line in output.splitlines():
+            record = orjson.loads(line)
+            response = record.get("response") or {}
+            if response.get("status_code") == 200:
+                responses[int(record["custom_id"])] = response["body"]["choices"][0]["message"]["content"]
+
+        return responses
 
 
 class RemediationRecommender:
-    def __init__(self, model_name="gpt-4"):
-        """Initialize the remediation recommender with specified LLM."""
-        self.llm = OpenAI(model_name=model_name)
+    def __init__(self, model_name="gpt-4", batch_size=5, max_concurrency=8, requests_per_minute=None,
+                 tokens_per_minute=None, temperature=0, cache_path=LLM_CACHE_PATH, use_batch=False,
+                 max_prompt_tokens=3000, utility_model="gpt-4o-mini"):
+        """Initialize the remediation recommender with specified LLMs.
+
+        model_name is used for the remediation plans, which need reasoning about the failures; the
+        cheaper and faster utility_model handles the mechanical conversion of automation pseudocode
+        to Python and the formatting of the audit report.
+
+        batch_size is the number of failed rules sent to the LLM in a single prompt. LLM requests
+        run concurrently, at most max_concurrency at a time and paced to the optional
+        requests_per_minute and tokens_per_minute limits. The temperature defaults to 0 rather than
+        LangChain's 0.7, so plans are reproducible and can be cached: responses are cached in the SQLite
+        database at cache_path unless it is None or the temperature is above zero. The cache belongs to
+        these LLMs only; other LLMs in the process are not affected. With use_batch, remediation
+        plans are generated through the OpenAI Batch API instead, which is cheaper but slower.
+        Failed record samples are trimmed so they take at most max_prompt_tokens per prompt.
+        """
+        llm_cache = sqlite_llm_cache(cache_path) if cache_path is not None and temperature == 0 else False
+
+        self.llm = OpenAI(model_name=model_name, temperature=temperature, cache=llm_cache, streaming=True)
+        self.utility_llm = OpenAI(model_name=utility_model, temperature=temperature, cache=llm_cache)
+        self.batch_size = batch_size
+        self.max_concurrency = max_concurrency
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.batch_client = BatchLLMClient(model_name, temperature) if use_batch else None
+        self.max_prompt_tokens = max_prompt_tokens
+        try:
+            self._enc = tiktoken.encoding_for_model(model_name)
+        except KeyError:
+            self._enc = tiktoken.get_encoding("cl100k_base")
+        # Compiled remediation functions keyed by the SHA-256 of the plan's automation code
+        self._code_cache = {}
         self.logger = logging.getLogger(__name__)
 
+    def _rate_limiter(self):
+        """Create a rate limiter for one run; asyncio primitives are bound to the running event loop."""
+        return RateLimiter(self.max_concurrency, self.requests_per_minute, self.tokens_per_minute)
+
+    @llm_retry
+    async def _acall_llm(self, prompt, limiter, llm=None):
+        """Call the LLM, by default the reasoning one, asynchronously within the concurrency and rate limits."""
+        llm = llm or self.llm
+        async with limiter.semaphore:
+            await limiter.wait(self._count_tokens(prompt))
+            result = await llm.agenerate([prompt])
+        return result.generations[0][0].text
+
+    @llm_retry
+    async def _acall_llm_json(self, prompt, limiter):
+        """Call the reasoning LLM with a streamed response, stopping as soon as the JSON value in it is complete."""
+        collector = JsonStreamCollector()
+        async with limiter.semaphore:
+            await limiter.wait(self._count_tokens(prompt))
+            try:
+                result = await self.llm.agenerate([prompt], callbacks=[collector])
+            except JsonComplete:
+                text = collector.text()
+                # The stopped generation never reaches LangChain's cache, so store the JSON in it here,
+                # but only once it parses so a bad response is never cached for good
+                try:
+                    orjson.loads(text)
+                except orjson.JSONDecodeError:
+                    return text
+                update_llm_cache(self.llm, prompt, text)
+                return text
+        return result.generations[0][0].text
+
+    @llm_retry
+    def _call_llm_with_retry(self, prompt, llm=None):
+        """Call the LLM, by default the reasoning one, synchronously."""
+        return (llm or self.llm)(prompt)
+
+    def _count_tokens(self, text):
+        """Count the model tokens in a piece of text."""
+        return len(self._enc.encode(text, disallowed_special=()))
+
+    def _fit_failed_data(self, failed_data, budget):
+        """Serialize failed record samples as compact JSON, dropping records from the end to fit a token budget."""
+        records = list(failed_data)
+        while records:
+            if self._count_tokens(_dumps(records)) <= budget:
+                return records
+            records.pop()
+        return records
+
+    @staticmethod
+    def _summarize_rule_result(rule_result):
+        """Summarize a rule result for a prompt, replacing the full failed record list with a count and sample."""
+        failed_records = rule_result.get("failed_records", [])
+        return {
+            "passed": rule_result.get("passed"),
+            "failed_count": len(failed_records),
+            "sample_failed_records": failed_records[:10]
+        }
+
     def generate_remediation_recommendations(self, validation_results, data, rule_templates):
         """Generate remediation recommendations for failed validations."""
+        return asyncio.run(self.generate_remediation_recommendations_async(validation_results, data, rule_templates))
+
+    async def generate_remediation_recommendations_async(self, validation_results, data, rule_templates):
+        """Generate remediation recommendations for failed validations, with the LLM calls running concurrently."""
         recommendations = {
             "summary": {
                 "total_issues": 0,
@@ -26,8 +385,9 @@ class RemediationRecommender:
         if "rule_results" not in validation_results:
             return recommendations
 
+        rule_results = validation_results["rule_results"]
         failed_rules = [
-            rule_id for rule_id, result in validation_results["rule_results"].items()
+            rule_id for rule_id, result in rule_results.items()
             if not result.get("passed", True)
         ]
 
@@ -37,164 +397,278 @@ class RemediationRecommender:
         if not failed_rules:
             return recommendations
 
-        # Get rule details from templates
+        # Get rule details from templates, checking membership against a set rather than the list
+        failed_rules_set = set(failed_rules)
         rule_details = {
             rule["rule_id"]: rule for rule in rule_templates
-            if rule["rule_id"] in failed_rules
+            if rule["rule_id"] in failed_rules_set
+        }
+
+        # Look up the sample failed records of all rules with a single positional selection; failed_records
+        # holds index labels, as a list or a NumPy array, which are resolved to positions once
+        sample_indices = {
+            index for rule_id in failed_rules
+            for index in rule_results[rule_id].get("failed_records", [])[:10]
         }
+        positions = data.index.get_indexer_for(list(sample_indices))
+        samples = data.iloc[np.unique(positions[positions >= 0])]
+        sample_records = samples[~samples.index.duplicated()].to_dict(orient='index')
 
-        # Process each failed rule
+        # Collect the details of each failed rule
+        failed_rule_details = []
         for rule_id in failed_rules:
-            rule_result = validation_results["rule_results"].get(rule_id, {})
+            rule_result = rule_results[rule_id]
             rule_info = rule_details.get(rule_id, {})
 
             # Get failed records
             failed_indices = rule_result.get("failed_records", [])
-            if not failed_indices:
+            if len(failed_indices) == 0:
                 continue
 
             # Get sample of failed data
-            failed_data = data.loc[failed_indices[:10]].to_dict(orient='records')
-
-            # Generate remediation plan
-            remediation_plan = self._generate_single_remediation(
-                rule_id, rule_info, rule_result, failed_data
-            )
+            failed_data = [sample_records[index] for index in failed_indices[:10] if index in sample_records]
+            failed_rule_details.append((rule_id, rule_info, rule_result, failed_data))
 
-            # Categorize the remediation
-            if remediation_plan["can_automate"]:
-                recommendations["summary"]["remediated_issues"] += 1
-            else:
-                recommendations["summary"]["manual_review_issues"] += 1
+        # Generate remediation plans for several rules per LLM call, with the batches running concurrently
+        batches = [
+            failed_rule_details[start:start + self.batch_size]
+            for start in range(0, len(failed_rule_details), self.batch_size)
+        ]
+        if self.batch_client:
+            batch_results = await asyncio.to_thread(self._generate_plans_with_batch_api, batches)
+        else:
+            limiter = self._rate_limiter()
+            batch_results = await asyncio.gather(*[self._generate_batch_plans(batch, limiter) for batch in batches])
+
+        for batch_plans in batch_results:
+            for rule_id, remediation_plan in batch_plans:
+                # Categorize the remediation
+                if remediation_plan["can_automate"]:
+                    recommendations["summary"]["remediated_issues"] += 1
+                else:
+                    recommendations["summary"]["manual_review_issues"] += 1
 
-            recommendations["remediation_plans"][rule_id] = remediation_plan
+                recommendations["remediation_plans"][rule_id] = remediation_plan
 
         return recommendations
 
-    def _generate_single_remediation(self, rule_id, rule_info, rule_result, failed_data):
-        """Generate remediation plan for a single failed rule."""
-        # Prepare the prompt for the LLM
-        prompt_template = PromptTemplate(
-            input_variables=["rule_id", "rule_info", "failed_data", "rule_result"],
-            template="""
-            Generate a remediation plan for the following validation issue:
+    async def _generate_batch_plans(self, batch, limiter):
+        """Generate remediation plans for a batch of failed rules, retrying rules missing from the batch response."""
+        batch_plans = await self._generate_batched_remediations(batch, limiter)
 
-            Rule ID: {rule_id}
-            Rule Type: {rule_info[type]}
-            Rule Description: {rule_info[description]}
-            Severity: {rule_info[severity]}
+        # Retry rules missing from the batch response on their own
+        missing = [details for details in batch if details[0] not in batch_plans]
+        retried_plans = await asyncio.gather(*[
+            self._generate_single_remediation(rule_id, rule_info, rule_result, failed_data, limiter)
+            for rule_id, rule_info, rule_result, failed_data in missing
+        ])
+        for (rule_id, _, _, _), remediation_plan in zip(missing, retried_plans):
+            batch_plans[rule_id] = remediation_plan
 
-            The validation failed on these example records:
-            {failed_data}
+        return [(rule_id, batch_plans[rule_id]) for rule_id, _, _, _ in batch]
 
-            Based on this information, please provide:
-            1. A concise explanation of why the data likely failed this validation
-            2. Step-by-step remediation actions that could be taken
-            3. Whether this could be remediated automatically (true/false)
-            4. If automatic remediation is possible, provide pseudocode for the fix
-            5. A suggested explanation for auditors about this issue
+    def _generate_plans_with_batch_api(self, batches):
+        """Generate remediation plans for all batches of failed rules with OpenAI Batch API submissions.
 
-            Format your response as a JSON object with the following structure:
-            ```
-            {{
-                "explanation": "Clear explanation of the issue",
-                "remediation_steps": ["Step 1", "Step 2", "..."],
-                "can_automate": true/false,
-                "automation_code": "Pseudocode or actual code for fixing the issue",
-                "auditor_explanation": "Explanation suitable for auditors"
-            }}
-            ```
-            """
-        )
+        Rules missing from the batch responses are retried individually in a second submission.
+        """
+        # Submit one prompt per batch of several rules
+        multi_rule_batches = [batch for batch in batches if len(batch) > 1]
+        responses = self.batch_client.submit([self._batch_remediation_prompt(batch) for batch in multi_rule_batches])
 
-        # Format the prompt
-        formatted_prompt = prompt_template.format(
-            rule_id=rule_id,
-            rule_info=rule_info,
-            failed_data=json.dumps(failed_data, indent=2),
-            rule_result=json.dumps(rule_result, indent=2)
-        )
+        plans = {}
+        for batch, llm_response in zip(multi_rule_batches, responses):
+            if llm_response is not None:
+                plans.update(self._parse_batched_remediations(llm_response, batch))
 
-        try:
-            # Get remediation plan from LLM
-            llm_response = self.llm(formatted_prompt)
+        # Retry rules missing from the batch responses on their own
+        missing = [details for batch in batches for details in batch if details[0] not in plans]
+        responses = self.batch_client.submit([self._single_remediation_prompt(*details) for details in missing])
 
-            # Parse JSON response
-            # Extract JSON from the response if it's wrapped in backticks
-            json_str = llm_response
-            if "```" in llm_response:
-                json_str = llm_response.split("```")[1]
-                if json_str.startswith("json"):
-                    json_str = json_str[4:].strip()
+        for (rule_id, rule_info, _, _), llm_response in zip(missing, responses):
+            try:
+                if llm_response is None:
+                    raise ValueError("No response from the batch")
+                plans[rule_id] = self._parse_single_remediation(llm_response, rule_id, rule_info)
+            except Exception as e:
+                self.logger.error(f"Error generating remediation for rule {rule_id}: {str(e)}")
+                plans[rule_id] = self._fallback_remediation_plan(rule_id, rule_info)
 
-            remediation_plan = json.loads(json_str)
+        return [[(rule_id, plans[rule_id]) for rule_id, _, _, _ in batch] for batch in batches]
 
-            # Validate the structure
-            required_keys = ["explanation", "remediation_steps", "can_automate", "auditor_explanation"]
-            for key in required_keys:
-                if key not in remediation_plan:
-                    remediation_plan[key] = "Not provided"
+    async def _generate_batched_remediations(self, failed_rule_details, limiter):
+        """Generate remediation plans for several failed rules with a single LLM call.
 
-            # Add metadata
-            remediation_plan["rule_id"] = rule_id
-            remediation_plan["rule_type"] = rule_info.get("type", "unknown")
-            remediation_plan["severity"] = rule_info.get("severity", "unknown")
+        Returns a dict of remediation plans keyed by rule_id. Rules whose plan could not be
+        parsed from the response are left out so the caller can retry them individually.
+        """
+        if len(failed_rule_details) == 1:
+            return {}
 
-            return remediation_plan
+        formatted_prompt = self._batch_remediation_prompt(failed_rule_details)
 
+        try:
+            llm_response = await self._acall_llm_json(formatted_prompt, limiter)
         except Exception as e:
-            self.logger.error(f"Error generating remediation for rule {rule_id}: {str(e)}")
-            # Return a fallback plan
-            return {
+            self.logger.warning(f"Could not generate batched remediations, retrying rules individually: {str(e)}")
+            return {}
+
+        return self._parse_batched_remediations(llm_response, failed_rule_details)
+
+    def _batch_remediation_prompt(self, failed_rule_details):
+        """Build the prompt asking for remediation plans for several failed rules."""
+        # Share the failed record budget between the rules of the batch
+        budget = self.max_prompt_tokens // len(failed_rule_details)
+        batch = [
+            {
                 "rule_id": rule_id,
                 "rule_type": rule_info.get("type", "unknown"),
+                "rule_description": rule_info.get("description", ""),
                 "severity": rule_info.get("severity", "unknown"),
-                "explanation": "Could not generate explanation due to an error.",
-                "remediation_steps": ["Manual review required"],
-                "can_automate": False,
-                "automation_code": "N/A",
-                "auditor_explanation": "Validation failed, but automatic remediation recommendation could not be generated. Manual review required."
+                "failed_data": self._fit_failed_data(failed_data, budget),
+                "rule_result_summary": self._summarize_rule_result(rule_result)
             }
+            for rule_id, rule_info, rule_result, failed_data in failed_rule_details
+        ]
+        return BATCH_REMEDIATION_PROMPT.format(batch=_dumps(batch))
+
+    def _parse_batched_remediations(self, llm_response, failed_rule_details):
+        """Parse the remediation plans for several failed rules from an LLM response, keyed by rule_id."""
+        try:
+            batch_plans = orjson.loads(self._extract_json_str(llm_response))
+        except Exception as e:
+            self.logger.warning(f"Could not parse batched remediations, retrying rules individually: {str(e)}")
+            return {}
+
+        if not isinstance(batch_plans, list):
+            return {}
+
+        rule_infos = {rule_id: rule_info for rule_id, rule_info, _, _ in failed_rule_details}
+        remediation_plans = {}
+        for plan in batch_plans:
+            if isinstance(plan, dict) and plan.get("rule_id") in rule_infos:
+                rule_id = plan["rule_id"]
+                remediation_plans[rule_id] = self._complete_remediation_plan(plan, rule_id, rule_infos[rule_id])
+
+        return remediation_plans
+
+    @staticmethod
+    def _extract_json_str(llm_response):
+        """Extract the JSON from an LLM response if it's wrapped in backticks."""
+        fence = _JSON_FENCE_RE.search(llm_response)
+        return fence.group(1) if fence else llm_response
+
+    @staticmethod
+    def _complete_remediation_plan(remediation_plan, rule_id, rule_info):
+        """Fill in missing keys of a parsed remediation plan and add the rule metadata."""
+        # Validate the structure
+        required_keys = ["explanation", "remediation_steps", "can_automate", "auditor_explanation"]
+        for key in required_keys:
+            if key not in remediation_plan:
+                remediation_plan[key] = "Not provided"
+
+        # Add metadata
+        remediation_plan["rule_id"] = rule_id
+        remediation_plan["rule_type"] = rule_info.get("type", "unknown")
+        remediation_plan["severity"] = rule_info.get("severity", "unknown")
+
+        return remediation_plan
+
+    async def _generate_single_remediation(self, rule_id, rule_info, rule_result, failed_data, limiter):
+        """Generate remediation plan for a single failed rule."""
+        formatted_prompt = self._single_remediation_prompt(rule_id, rule_info, rule_result, failed_data)
+
+        try:
+            # Get remediation plan from LLM
+            llm_response = await self._acall_llm_json(formatted_prompt, limiter)
+
+            return self._parse_single_remediation(llm_response, rule_id, rule_info)
+
+        except Exception as e:
+            self.logger.error(f"Error generating remediation for rule {rule_id}: {str(e)}")
+            return self._fallback_remediation_plan(rule_id, rule_info)
+
+    def _single_remediation_prompt(self, rule_id, rule_info, rule_result, failed_data):
+        """Build the prompt asking for the remediation plan of a single failed rule."""
+        # Format the prompt
+        return REMEDIATION_PROMPT.format(
+            rule_id=rule_id,
+            rule_info=rule_info,
+            failed_data=_dumps(self._fit_failed_data(failed_data, self.max_prompt_tokens)),
+            rule_result=_dumps(self._summarize_rule_result(rule_result))
+        )
+
+    def _parse_single_remediation(self, llm_response, rule_id, rule_info):
+        """Parse the remediation plan of a single failed rule from an LLM response."""
+        # Parse JSON response
+        remediation_plan = orjson.loads(self._extract_json_str(llm_response))
+
+        return self._complete_remediation_plan(remediation_plan, rule_id, rule_info)
+
+    @staticmethod
+    def _fallback_remediation_plan(rule_id, rule_info):
+        """Build the plan used when no remediation could be generated for a rule."""
+        return {
+            "rule_id": rule_id,
+            "rule_type": rule_info.get("type", "unknown"),
+            "severity": rule_info.get("severity", "unknown"),
+            "explanation": "Could not generate explanation due to an error.",
+            "remediation_steps": ["Manual review required"],
+            "can_automate": False,
+            "automation_code": "N/A",
+            "auditor_explanation": "Validation failed, but automatic remediation recommendation could not be generated. Manual review required."
+        }
 
     def apply_automatic_remediations(self, data, remediation_plans):
         """Apply automatic remediations to the data where possible."""
+        return asyncio.run(self.apply_automatic_remediations_async(data, remediation_plans))
+
+    async def apply_automatic_remediations_async(self, data, remediation_plans):
+        """Apply automatic remediations to the data, generating the remediation code for all rules concurrently."""
         remediated_data = data.copy()
         applied_remediations = []
 
-        for rule_id, plan in remediation_plans.items():
-            if not plan.get("can_automate", False):
-                continue
-
-            try:
-                # Convert the automation code to executable Python
-                # This is just a placeholder - in practice, you'd need a more sophisticated approach
-                automation_prompt = f"""
-                Convert the following remediation pseudocode to executable Python code 
-                that can be applied to a pandas DataFrame named 'df':
-
-                {plan.get('automation_code', '')}
-
-                The code should:
-                1. Accept a pandas DataFrame as input
-                2. Apply the remediation logic
-                3. Return the modified DataFrame
-                4. Include appropriate error handling
+        automatable = [
+            (rule_id, plan) for rule_id, plan in remediation_plans.items()
+            if plan.get("can_automate", False)
+        ]
 
-                Return only the Python function definition.
-                """
+        # Only automation code that has not been compiled before needs to go through the LLM
+        code_keys = {
+            rule_id: hashlib.sha256(plan.get("automation_code", "").encode("utf-8")).hexdigest()
+            for rule_id, plan in automatable
+        }
+        pending = {}
+        for rule_id, plan in automatable:
+            if code_keys[rule_id] not in self._code_cache:
+                pending.setdefault(code_keys[rule_id], plan)
+
+        # Convert the pending automation code concurrently; failures are returned as exceptions
+        limiter = self._rate_limiter()
+        generated_code = await asyncio.gather(
+            *[self._generate_remediation_code(plan, limiter) for plan in pending.values()],
+            return_exceptions=True
+        )
 
-                code = self.llm(automation_prompt)
+        # Compile each generated function once, remembering failures for this run only
+        errors = {}
+        for code_key, code in zip(pending, generated_code):
+            try:
+                if isinstance(code, Exception):
+                    raise code
+                remediation_func = self._compile_remediation(code)
+                if remediation_func:
+                    self._code_cache[code_key] = remediation_func
+            except Exception as e:
+                errors[code_key] = e
 
-                # Create a function from the code
-                local_vars = {}
-                exec(code, globals(), local_vars)
+        # Apply the remediations sequentially, in plan order, since each one modifies the data
+        for rule_id, plan in automatable:
+            try:
+                if code_keys[rule_id] in errors:
+                    raise errors[code_keys[rule_id]]
 
-                # Find the function in local_vars
-                remediation_func = None
-                for func in local_vars.values():
-                    if callable(func):
-                        remediation_func = func
-                        break
+                remediation_func = self._code_cache.get(code_keys[rule_id])
 
                 if remediation_func:
                     # Apply the remediation
@@ -220,6 +694,30 @@ class RemediationRecommender:
 
         return remediated_data, applied_remediations
 
+    @staticmethod
+    def _compile_remediation(code):
+        """Compile generated remediation code and return the first function it defines, or None."""
+        # Run the code in its own namespace so its imports and helpers don't leak into this module.
+        # Seed it with the modules generated code may use without importing them, as it could in this module
+        namespace = {"pd": pd, "np": np, "json": json}
+        exec(compile(code, "<remediation>", "exec"), namespace)
+
+        for func in namespace.values():
+            if isinstance(func, types.FunctionType) and func.__code__.co_filename == "<remediation>":
+                return func
+        return None
+
+    async def _generate_remediation_code(self, plan, limiter):
+        """Convert a remediation plan's automation code to an executable Python function."""
+        # This is just a placeholder - in practice, you'd need a more sophisticated approach
+        automation_prompt = AUTOMATION_PROMPT.format(automation_code=plan.get('automation_code', ''))
+
+        code = await self._acall_llm(automation_prompt, limiter, self.utility_llm)
+
+        # Extract the code if it's wrapped in backticks
+        fence = _PYTHON_FENCE_RE.search(code)
+        return fence.group(1) if fence else code
+
     def generate_audit_report(self, validation_results, remediation_plans, applied_remediations):
         """Generate a comprehensive audit report for documentation purposes."""
         # Prepare data for the report
@@ -262,20 +760,7 @@ class RemediationRecommender:
             })
 
         # Generate the report using LLM
-        report_prompt = f"""
-        Generate a comprehensive audit report based on the following validation and remediation information:
-
-        {json.dumps(report_data, indent=2)}
-
-        The report should include:
-        1. An executive summary
-        2. Validation results overview
-        3. Remediation actions taken
-        4. Issues requiring manual review
-        5. Recommendations for process improvement
-
-        Format the report as a well-structured markdown document with appropriate headings, lists, and formatting.
-        """
+        report_prompt = AUDIT_REPORT_PROMPT.format(report_data=_dumps(report_data, orjson.OPT_INDENT_2))
 
-        audit_report = self.llm(report_prompt)
+        audit_report = self._call_llm_with_retry(report_prompt, self.utility_llm)
         return audit_report
@@ -1,5 +1,10 @@
 import os
 import re
+import shutil
+import json
+import hashlib
+import itertools
+from concurrent.futures import ThreadPoolExecutor
 import pandas as pd
 from langchain.document_loaders import PyPDFLoader, CSVLoader, TextLoader
 from langchain.text_splitter import RecursiveCharacterTextSplitter
@@ -7,14 +12,33 @@ from langchain.embeddings import OpenAIEmbeddings
 from langchain.vectorstores import Chroma
 from langchain.chains import RetrievalQA
 from langchain.llms import OpenAI
+from DocDash.common.llm import LLM_CACHE_PATH, sqlite_llm_cache
+
+
+# Written into a persisted vector store directory once the store is complete
+PERSIST_COMPLETE_MARKER = ".complete"
 
 
 class RegulatoryInstructionProcessor:
-    def __init__(self, model_name="gpt-4", embedding_model="text-embedding-ada-002"):
-        """Initialize the processor with specified LLM and embedding models."""
-        self.llm = OpenAI(model_name=model_name)
+    def __init__(self, model_name="gpt-4", embedding_model="text-embedding-ada-002", temperature=0,
+                 cache_path=LLM_CACHE_PATH, persist_root=".chroma", max_workers=8):
+        """Initialize the processor with specified LLM and embedding models.
+
+        The temperature defaults to 0 rather than LangChain's 0.7, so extracted requirements are
+        reproducible and can be cached: LLM responses are cached in the SQLite database at cache_path
+        unless it is None or the temperature is above zero. The cache belongs to this processor's LLM
+        only; other LLMs in the process are not affected. Vector stores are persisted under persist_root, one directory per
+        document corpus, so unchanged documents are not embedded again. Documents are loaded by up to
+        max_workers threads.
+        """
+        llm_cache = sqlite_llm_cache(cache_path) if cache_path is not None and temperature == 0 else False
+
+        self.llm = OpenAI(model_name=model_name, temperature=temperature, cache=llm_cache)
         self.embeddings = OpenAIEmbeddings(model=embedding_model)
+        self.embedding_model = embedding_model
         self.text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=100)
+        self.persist_root = persist_root
+        self.max_workers = max_workers
         self.vector_db = None
 
     def load_documents(self, document_path):
@@ -36,65 +60,92 @@ class RegulatoryInstructionProcessor:
 
         return documents
 
-    def process_documents(self, document_paths):
-        """Process multiple documents and create a vector store."""
-        all_documents = []
+    def _corpus_hash(self, document_paths):
+        """Hash the document contents and embedding model, independent of the document order."""
+        content_hashes = []
         for path in document_paths:
-            documents = self.load_documents(path)
-            all_documents.extend(documents)
+            with open(path, 'rb') as f:
+                content_hashes.append(hashlib.sha256(f.read()).hexdigest())
+
+        corpus = "|".join([self.embedding_model] + sorted(content_hashes))
+        return hashlib.sha256(corpus.encode("utf-8")).hexdigest()
+
+    def process_documents(self, document_paths):
+        """Process multiple documents and create a vector store, reusing the persisted one for the same corpus."""
+        persist_dir = os.path.join(self.persist_root, self._corpus_hash(document_paths))
+        complete_marker = os.path.join(persist_dir, PERSIST_COMPLETE_MARKER)
+        if os.path.exists(complete_marker):
+            self.vector_db = Chroma(persist_directory=persist_dir, embedding_function=self.embeddings)
+            return
+
+        # A store without the marker was left half-written by an interrupted run, so build it again
+        shutil.rmtree(persist_dir, ignore_errors=True)
+
+        # Load the documents concurrently; the loaders are dominated by file IO and parsing
+        with ThreadPoolExecutor(max_workers=max(1, min(self.max_workers, len(document_paths)))) as executor:
+            all_documents = list(itertools.chain.from_iterable(executor.map(self.load_documents, document_paths)))
 
         chunks = self.text_splitter.split_documents(all_documents)
-        self.vector_db = Chroma.from_documents(chunks, self.embeddings)
+        self.vector_db = Chroma.from_documents(chunks, self.embeddings, persist_directory=persist_dir)
+        self.vector_db.persist()
+
+        # Only mark the store as reusable once it has been fully written
+        with open(complete_marker, 'w'):
+            pass
 
     def extract_validation_requirements(self):
-        """Extract data validation requirements from processed documents."""
+        """Extract data validation requirements from processed documents.
+
+        Returns the requirements by kind, or the raw LLM response if it is not a JSON object.
+        """
         if not self.vector_db:
             raise ValueError("No documents have been processed yet.")
 
-        retriever = self.vector_db.as_retriever(search_kwargs={"k": 5})
+        # One retrieval serves all four kinds of requirements, so retrieve more context than for a single query
+        retriever = self.vector_db.as_retriever(search_kwargs={"k": 10})
         qa_chain = RetrievalQA.from_chain_type(
             llm=self.llm,
             chain_type="stuff",
             retriever=retriever
         )
 
-        # Extract allowable values
-        allowable_values_query = """
-        Extract all mentions of allowable values, valid ranges, or permitted values for data elements.
-        Format the output as a JSON object with the field name as key and the allowable values as values.
-        """
-        allowable_values = qa_chain.run(allowable_values_query)
-
-        # Extract required fields
-        required_fields_query = """
-        Identify all mandatory fields or required elements mentioned in the regulatory documents.
-        Format the output as a JSON array of field names.
+        # Extract all requirement kinds with a single query
+        requirements_query = """
+        Extract the data validation requirements from the regulatory documents.
+        Return a single JSON object with the following keys:
+        - "allowable_values": all mentions of allowable values, valid ranges, or permitted values for data elements,
+          as a JSON object with the field name as key and the allowable values as values
+        - "required_fields": all mandatory fields or required elements, as a JSON array of field names
+        - "cross_validations": all rules that describe relationships or dependencies between different data elements,
+          as a JSON array of objects, each containing the fields involved and the rule description
+        - "data_types": all data type constraints for each field (e.g., numeric, date, string, etc.),
+          as a JSON object with field names as keys and data types as values
+        Return only the JSON object.
         """
-        required_fields = qa_chain.run(required_fields_query)
+        response = qa_chain.run(requirements_query)
 
-        # Extract cross-field validation rules
-        cross_validation_query = """
-        Extract all rules that describe relationships or dependencies between different data elements.
-        Format the output as a JSON array of objects, each containing the fields involved and the rule description.
-        """
-        cross_validations = qa_chain.run(cross_validation_query)
+        json_match = re.search(r"\{.*\}", response, re.DOTALL)
+        try:
+            requirements = json.loads(json_match.group(0) if json_match else response)
+        except json.JSONDecodeError:
+            requirements = None
 
-        # Extract data type constraints
-        data_type_query = """
-        Identify all data type constraints for each field (e.g., numeric, date, string, etc.).
-        Format the output as a JSON object with field names as keys and data types as values.
-        """
-        data_types = qa_chain.run(data_type_query)
+        # Keep the raw response when it isn't a JSON object, the refinement step reads it as text
+        if not isinstance(requirements, dict):
+            return response
 
         return {
-            "allowable_values": allowable_values,
-            "required_fields": required_fields,
-            "cross_validations": cross_validations,
-            "data_types": data_types
+            "allowable_values": requirements.get("allowable_values", {}),
+            "required_fields": requirements.get("required_fields", []),
+            "cross_validations": requirements.get("cross_validations", []),
+            "data_types": requirements.get("data_types", {})
         }
 
     def refine_requirements(self, extracted_requirements):
-        """Use LLM to refine and standardize the extracted requirements."""
+        """Use LLM to refine and standardize the extracted requirements.
+
+        Returns a list of structured requirements, or the raw LLM response if it is not valid JSON.
+        """
         refinement_prompt = f"""
         Given the following extracted data validation requirements, please:
         1. Standardize the format of all rules
@@ -105,8 +156,26 @@ class RegulatoryInstructionProcessor:
         Requirements to refine:
         {extracted_requirements}
 
-        Return the refined requirements in a structured JSON format.
+        Return the refined requirements as a JSON array with one object per requirement, with the following structure:
+        {{
+            "element": "The field the requirement applies to",
+            "check_type": "One of range_check, categorical_check, not_null_check, cross_field_check",
+            "params": {{
+                "min": "Lower bound, for range_check (omit if unbounded)",
+                "max": "Upper bound, for range_check (omit if unbounded)",
+                "values": ["Allowed values, for categorical_check"],
+                "other_element": "The related field, for cross_field_check"
+            }},
+            "severity": "error, warning or info",
+            "description": "The requirement in plain language"
+        }}
+        Return only the JSON array.
         """
 
         refined_requirements = self.llm(refinement_prompt)
-        return refined_requirements
+
+        json_match = re.search(r"\[.*\]", refined_requirements, re.DOTALL)
+        try:
+            return json.loads(json_match.group(0) if json_match else refined_requirements)
+        except ValueError:
+            return refined_requirements
@@ -1,8 +1,11 @@
 import os
-import json
+import gzip
+import orjson
+import asyncio
 import pandas as pd
 import logging
 from datetime import datetime
+from DocDash.common.serialization import ORJSON_OPTIONS
 
 
 class AIDataProfilerOrchestrator:
@@ -32,6 +35,10 @@ class AIDataProfilerOrchestrator:
         self.validation_results = None
         self.remediation_plans = None
 
+        # The first file data source, read once and shared by all pipeline steps
+        self._cached_path = None
+        self._cached_df = None
+
     def add_regulatory_document(self, document_path):
         """Add a regulatory document to be processed."""
         if os.path.exists(document_path):
@@ -51,6 +58,36 @@ class AIDataProfilerOrchestrator:
         else:
             self.logger.error("No valid data source provided")
 
+    @staticmethod
+    def _maybe_copy(df, mutates):
+        """Copy a DataFrame only for consumers that modify it in place."""
+        return df.copy() if mutates else df
+
+    def _load_source(self, data=None, mutates=False):
+        """Return the provided data or the first data source as a DataFrame.
+
+        File data sources are read once and the same frame is returned to every later step, so
+        consumers that modify the frame in place must pass mutates=True to get their own copy.
+        """
+        if data is not None:
+            if isinstance(data, pd.DataFrame):
+                return self._maybe_copy(data, mutates)
+            return pd.DataFrame(data)
+
+        source = self.data_sources[0]
+        if source["type"] != "file":
+            return self._maybe_copy(source["data"], mutates)
+
+        if self._cached_path != source["path"]:
+            try:
+                self._cached_df = pd.read_csv(source["path"], engine="pyarrow")
+            except ImportError:
+                self._cached_df = pd.read_csv(source["path"])
+            self._cached_path = source["path"]
+            self.logger.info(f"Loaded data source file: {source['path']}")
+
+        return self._maybe_copy(self._cached_df, mutates)
+
     def process_regulatory_documents(self):
         """Process regulatory documents to extract validation requirements."""
         if not self.regulatory_docs:
@@ -109,16 +146,8 @@ class AIDataProfilerOrchestrator:
             self.logger.warning("No validation code available. Please generate validation code first.")
             return None
 
-        # Use the provided data or the first data source
-        df = None
-        if data is not None:
-            df = data.copy() if isinstance(data, pd.DataFrame) else pd.DataFrame(data)
-        else:
-            source = self.data_sources[0]
-            if source["type"] == "file":
-                df = pd.read_csv(source["path"])
-            else:
-                df = source["data"].copy()
+        # Use the provided data or the first data source; the generated validation code only reads it
+        df = self._load_source(data, mutates=False)
 
         self.logger.info(f"Validating data with {len(df)} rows...")
         self.validation_results = self.validation_code_generator.execute_validation_on_data(
@@ -141,16 +170,8 @@ class AIDataProfilerOrchestrator:
             self.logger.warning("No rule templates available. Required for remediation planning.")
             return None
 
-        # Use the provided data or the first data source
-        df = None
-        if data is not None:
-            df = data.copy() if isinstance(data, pd.DataFrame) else pd.DataFrame(data)
-        else:
-            source = self.data_sources[0]
-            if source["type"] == "file":
-                df = pd.read_csv(source["path"])
-            else:
-                df = source["data"].copy()
+        # Use the provided data or the first data source; remediation planning only samples failed records
+        df = self._load_source(data, mutates=False)
 
         self.logger.info("Generating remediation plans...")
         self.remediation_plans = self.remediation_recommender.generate_remediation_recommendations(
@@ -169,16 +190,8 @@ class AIDataProfilerOrchestrator:
             self.logger.warning("No remediation plans available. Please generate remediation plans first.")
             return None, []
 
-        # Use the provided data or the first data source
-        df = None
-        if data is not None:
-            df = data.copy() if isinstance(data, pd.DataFrame) else pd.DataFrame(data)
-        else:
-            source = self.data_sources[0]
-            if source["type"] == "file":
-                df = pd.read_csv(source["path"])
-            else:
-                df = source["data"].copy()
+        # Use the provided data or the first data source; the remediations are applied to a copy made by the recommender
+        df = self._load_source(data, mutates=False)
 
         self.logger.info("Applying automatic remediations...")
         remediated_data, applied_remediations = self.remediation_recommender.apply_automatic_remediations(
@@ -208,35 +221,50 @@ class AIDataProfilerOrchestrator:
 
     def run_end_to_end_pipeline(self, data=None, generate_report=True):
         """Run the complete end-to-end pipeline."""
+        return asyncio.run(self.run_end_to_end_pipeline_async(data, generate_report))
+
+    async def run_end_to_end_pipeline_async(self, data=None, generate_report=True):
+        """Run the complete end-to-end pipeline, overlapping stages that don't depend on each other.
+
+        The blocking stages run in worker threads so the data source is loaded while the regulatory
+        documents are processed.
+        """
         self.logger.info("Starting end-to-end pipeline...")
 
-        # Step 1: Process regulatory documents
-        self.process_regulatory_documents()
+        # Step 1: Process regulatory documents while the data is loaded
+        df = None
+        if data is not None or self.data_sources:
+            _, df = await asyncio.gather(
+                asyncio.to_thread(self.process_regulatory_documents),
+                asyncio.to_thread(self._load_source, data)
+            )
+        else:
+            await asyncio.to_thread(self.process_regulatory_documents)
 
         # Step 2: Generate validation rules
         if data is not None:
             sample_size = min(10000, len(data))
             data_sample = data.sample(sample_size) if hasattr(data, 'sample') else data[:sample_size]
-            self.generate_validation_rules(data_sample)
+            await asyncio.to_thread(self.generate_validation_rules, data_sample)
         else:
-            self.generate_validation_rules()
+            await asyncio.to_thread(self.generate_validation_rules)
 
         # Step 3: Generate validation code
         self.generate_validation_code()
 
         # Step 4: Validate data
-        self.validate_data(data)
+        await asyncio.to_thread(self.validate_data, df)
 
         # Step 5: Generate remediation plans
-        self.generate_remediation_plans(data)
+        await asyncio.to_thread(self.generate_remediation_plans, df)
 
         # Step 6: Apply remediations
-        remediated_data, applied_remediations = self.apply_remediations(data)
+        remediated_data, applied_remediations = await asyncio.to_thread(self.apply_remediations, df)
 
-        # Step 7: Generate audit report if requested
+        # Step 7: Generate audit report if requested; it covers the applied remediations, so it runs last
         audit_report = None
         if generate_report:
-            audit_report = self.generate_audit_report(applied_remediations)
+            audit_report = await asyncio.to_thread(self.generate_audit_report, applied_remediations)
 
         self.logger.info("End-to-end pipeline completed successfully")
 
@@ -248,15 +276,20 @@ class AIDataProfilerOrchestrator:
             "audit_report": audit_report
         }
 
+    @staticmethod
+    def _write_json_gz(path, obj):
+        """Write an object as gzip-compressed compact JSON."""
+        with gzip.open(path, 'wb', compresslevel=6) as f:
+            f.write(orjson.dumps(obj, default=str, option=ORJSON_OPTIONS))
+
     def save_results(self, output_dir):
-        """Save all results to files in the specified directory."""
+        """Save all results to files in the specified directory, with the JSON results gzip-compressed."""
         os.makedirs(output_dir, exist_ok=True)
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
 
         # Save rule templates
         if self.rule_templates:
-            with open(os.path.join(output_dir, f"rule_templates_{timestamp}.json"), 'w') as f:
-                json.dump(self.rule_templates, f, indent=2)
+            self._write_json_gz(os.path.join(output_dir, f"rule_templates_{timestamp}.json.gz"), self.rule_templates)
 
         # Save validation code
         if self.validation_code:
@@ -265,12 +298,10 @@ class AIDataProfilerOrchestrator:
 
         # Save validation results
         if self.validation_results:
-            with open(os.path.join(output_dir, f"validation_results_{timestamp}.json"), 'w') as f:
-                json.dump(self.validation_results, f, indent=2)
+            self._write_json_gz(os.path.join(output_dir, f"validation_results_{timestamp}.json.gz"), self.validation_results)
 
         # Save remediation plans
         if self.remediation_plans:
-            with open(os.path.join(output_dir, f"remediation_plans_{timestamp}.json"), 'w') as f:
-                json.dump(self.remediation_plans, f, indent=2)
+            self._write_json_gz(os.path.join(output_dir, f"remediation_plans_{timestamp}.json.gz"), self.remediation_plans)
 
         self.logger.info(f"Results saved to {output_dir}")
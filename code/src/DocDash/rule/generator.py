@@ -1,3 +1,4 @@
+import re
 import json
 import pandas as pd
 import numpy as np
@@ -6,15 +7,83 @@ from sklearn.ensemble import IsolationForest
 from sklearn.preprocessing import StandardScaler
 import great_expectations as ge
 from langchain.llms import OpenAI
+from DocDash.common.llm import LLM_CACHE_PATH, sqlite_llm_cache
+
+# Optional multi-process correlation, used for wide frames when installed
+try:
+    from nancorrmp.nancorrmp import NaNCorrMp
+except ImportError:
+    NaNCorrMp = None
+
+# Below this many numeric columns the single-threaded pandas correlation is faster
+PARALLEL_CORR_MIN_COLUMNS = 200
+
+# Optional JIT-compiled IQR kernel, used when numba is installed
+try:
+    from numba import njit, prange
+except ImportError:
+    njit = None
+
+if njit is not None:
+    @njit(parallel=True, cache=True)
+    def _iqr_bounds_kernel(columns):
+        """Compute the 1.5 IQR outlier bounds of each row of a 2D float array, ignoring NaNs."""
+        bounds = np.empty((columns.shape[0], 2))
+        for i in prange(columns.shape[0]):
+            q1 = np.nanpercentile(columns[i], 25.0)
+            q3 = np.nanpercentile(columns[i], 75.0)
+            iqr = q3 - q1
+            bounds[i, 0] = q1 - 1.5 * iqr
+            bounds[i, 1] = q3 + 1.5 * iqr
+        return bounds
+else:
+    _iqr_bounds_kernel = None
+
+
+def _typed_bound(bound):
+    """Convert a range bound to a float when it is numeric, e.g. 5, "5" or "1,000"; other bounds like dates stay as given."""
+    if bound is None or isinstance(bound, bool):
+        return bound
+    if isinstance(bound, (int, float)):
+        return float(bound)
+    text = str(bound).strip().strip("'\"")
+    try:
+        return float(text.replace(",", ""))
+    except ValueError:
+        return text
+
+
+# Bounds in the logic of LLM-generated range rules, e.g. "amount >= 0 AND amount <= 1000"
+_LOWER_BOUND_RE = re.compile(r">=\s*(.+?)\s*(?:\bAND\b|$)", re.IGNORECASE)
+_UPPER_BOUND_RE = re.compile(r"<=\s*(.+?)\s*(?:\bAND\b|$)", re.IGNORECASE)
 
 
 class RuleGenerator:
-    def __init__(self, model_name="gpt-4"):
-        """Initialize the rule generator with specified LLM."""
-        self.llm = OpenAI(model_name=model_name)
+    def __init__(self, model_name="gpt-4", temperature=0, cache_path=LLM_CACHE_PATH):
+        """Initialize the rule generator with specified LLM.
+
+        The temperature defaults to 0 rather than LangChain's 0.7, so responses are reproducible and
+        are cached in the SQLite database at cache_path unless it is None or the temperature is above zero.
+        """
+        llm_cache = sqlite_llm_cache(cache_path) if cache_path is not None and temperature == 0 else False
+
+        self.llm = OpenAI(model_name=model_name, temperature=temperature, cache=llm_cache)
 
     def generate_rule_templates(self, refined_requirements):
-        """Generate rule templates based on refined requirements."""
+        """Generate rule templates based on refined requirements.
+
+        Structured requirements (a list of dicts with an element and check_type) are filled into rule
+        templates directly; only free-text requirements need the LLM.
+        """
+        if isinstance(refined_requirements, list) and all(
+            isinstance(requirement, dict) and "element" in requirement and "check_type" in requirement
+            for requirement in refined_requirements
+        ):
+            return [
+                self._rule_from_requirement(rule_number, requirement)
+                for rule_number, requirement in enumerate(refined_requirements, start=1)
+            ]
+
         prompt = f"""
         Convert the following refined data validation requirements into rule templates
         that can be used to generate executable validation code:
@@ -31,8 +100,67 @@ class RuleGenerator:
         Return the rule templates in a structured JSON format.
         """
 
-        rule_templates = self.llm(prompt)
-        return json.loads(rule_templates)
+        rule_templates = json.loads(self.llm(prompt))
+
+        # Give LLM-generated range rules typed bounds once, so consumers never read them from the logic text
+        if isinstance(rule_templates, list):
+            for rule in rule_templates:
+                if isinstance(rule, dict) and rule.get("type") == "range_check":
+                    self._add_structured_bounds(rule)
+        return rule_templates
+
+    @staticmethod
+    def _add_structured_bounds(rule):
+        """Set typed lower_bound and upper_bound on a range rule that only describes them in its logic."""
+        if "lower_bound" in rule or "upper_bound" in rule:
+            return
+        logic = str(rule.get("logic", ""))
+        lower_match = _LOWER_BOUND_RE.search(logic)
+        upper_match = _UPPER_BOUND_RE.search(logic)
+        rule["lower_bound"] = _typed_bound(lower_match.group(1)) if lower_match else None
+        rule["upper_bound"] = _typed_bound(upper_match.group(1)) if upper_match else None
+
+    @staticmethod
+    def _rule_from_requirement(rule_number, requirement):
+        """Fill a rule template from a structured requirement."""
+        element = requirement["element"]
+        check_type = requirement["check_type"]
+        params = requirement.get("params") or {}
+        elements = [element]
+
+        structured = {}
+        if check_type == "range_check":
+            conditions = []
+            if params.get("min") is not None:
+                conditions.append(f"{element} >= {params['min']}")
+            if params.get("max") is not None:
+                conditions.append(f"{element} <= {params['max']}")
+            logic = " AND ".join(conditions)
+            # Numeric bounds become floats; dates and other bounds keep their value, never only the logic text
+            structured = {
+                "lower_bound": _typed_bound(params.get("min")),
+                "upper_bound": _typed_bound(params.get("max"))
+            }
+        elif check_type == "categorical_check":
+            logic = f"{element} IN {params.get('values', [])}"
+            structured = {"valid_values": list(params.get("values", []))}
+        elif check_type == "not_null_check":
+            logic = f"{element} IS NOT NULL"
+        elif check_type == "cross_field_check" and params.get("other_element"):
+            elements.append(params["other_element"])
+            logic = f"{element} == {params['other_element']}"
+        else:
+            logic = requirement.get("description", "")
+
+        return {
+            "rule_id": f"req_{rule_number:03d}_{element}",
+            "elements": elements,
+            "logic": logic,
+            "type": check_type,
+            "severity": requirement.get("severity", "warning"),
+            "description": requirement.get("description", logic),
+            **structured
+        }
 
     def discover_rules_from_data(self, data, sample_size=10000):
         """Discover additional rules based on unsupervised learning from sample data."""
@@ -40,30 +168,29 @@ class RuleGenerator:
         if not isinstance(data, pd.DataFrame):
             data = pd.DataFrame(data)
 
-        # Sample data if it's large
+        # Sample data if it's large; sorted row positions keep the gather in memory order
         if len(data) > sample_size:
-            data_sample = data.sample(sample_size, random_state=42)
+            sample_positions = np.sort(np.random.default_rng(42).choice(len(data), size=sample_size, replace=False))
+            data_sample = data.iloc[sample_positions]
         else:
             data_sample = data
 
         discovered_rules = []
 
         # 1. Statistical distribution rules for numeric columns
-        numeric_cols = data_sample.select_dtypes(include=[np.number]).columns
-        for col in numeric_cols:
-            # Skip columns with too many missing values
-            if data_sample[col].isna().sum() / len(data_sample) > 0.5:
-                continue
+        numeric_sample = data_sample.select_dtypes(include=[np.number])
 
-            values = data_sample[col].dropna()
+        # Skip columns with too many missing values, measured for all columns in one pass
+        na_frac = numeric_sample.isna().mean()
+        numeric_data = numeric_sample.loc[:, na_frac <= 0.5]
 
-            # Outlier detection using IQR
-            Q1 = values.quantile(0.25)
-            Q3 = values.quantile(0.75)
-            IQR = Q3 - Q1
-            lower_bound = Q1 - 1.5 * IQR
-            upper_bound = Q3 + 1.5 * IQR
+        # Outlier detection using IQR
+        lower_bounds, upper_bounds = self._iqr_bounds(numeric_data)
 
+        # Walk the columns and their bounds as parallel arrays instead of looking each column up by label
+        for col, lower_bound, upper_bound in zip(
+            numeric_data.columns, lower_bounds.to_numpy(dtype=np.float64), upper_bounds.to_numpy(dtype=np.float64)
+        ):
             discovered_rules.append({
                 "rule_id": f"auto_range_{col}",
                 "elements": [col],
@@ -71,17 +198,25 @@ class RuleGenerator:
                 "type": "range_check",
                 "severity": "warning",
                 "confidence": "medium",
-                "description": f"Value of {col} should typically be between {lower_bound:.2f} and {upper_bound:.2f}"
+                "description": f"Value of {col} should typically be between {lower_bound:.2f} and {upper_bound:.2f}",
+                "lower_bound": float(lower_bound),
+                "upper_bound": float(upper_bound)
             })
 
         # 2. Categorical value rules
         categorical_cols = data_sample.select_dtypes(include=['object', 'category']).columns
         for col in categorical_cols:
+            # A single hash pass encodes the strings as integer codes; the categories are the unique values.
+            # Columns that already were categorical keep their declared categories, so drop the unobserved ones
+            column = data_sample[col].astype('category').cat.remove_unused_categories()
+
             # Skip columns with too many unique values
-            if data_sample[col].nunique() > 20:
+            if len(column.cat.categories) > 20:
                 continue
 
-            value_counts = data_sample[col].value_counts(normalize=True)
+            # Counting integer codes needs no further string hashing
+            value_counts = column.value_counts()
+            value_counts = value_counts / value_counts.sum()
             common_values = value_counts[value_counts > 0.01].index.tolist()
 
             discovered_rules.append({
@@ -91,20 +226,23 @@ class RuleGenerator:
                 "type": "categorical_check",
                 "severity": "warning",
                 "confidence": "medium",
-                "description": f"{col} typically contains one of these values: {', '.join(map(str, common_values))}"
+                "description": f"{col} typically contains one of these values: {', '.join(map(str, common_values))}",
+                "valid_values": common_values
             })
 
         # 3. Discover potential correlations between columns
-        correlation_matrix = data_sample.select_dtypes(include=[np.number]).corr().abs()
+        if NaNCorrMp is not None and numeric_sample.shape[1] > PARALLEL_CORR_MIN_COLUMNS:
+            correlation_matrix = NaNCorrMp.calculate(numeric_sample, n_jobs=-1, chunks=500).abs()
+        else:
+            correlation_matrix = numeric_sample.corr().abs()
 
-        # Get pairs of columns with high correlation
-        corr_pairs = []
-        for i in range(len(correlation_matrix.columns)):
-            for j in range(i):
-                if correlation_matrix.iloc[i, j] > 0.8:  # Threshold for high correlation
-                    col1 = correlation_matrix.columns[i]
-                    col2 = correlation_matrix.columns[j]
-                    corr_pairs.append((col1, col2, correlation_matrix.iloc[i, j]))
+        # Get pairs of columns with high correlation from the lower triangle, in one vectorized comparison
+        corr_values = correlation_matrix.to_numpy()
+        rows, cols = np.tril_indices_from(corr_values, k=-1)
+        pair_values = corr_values[rows, cols]
+        high_corr = pair_values > 0.8  # Threshold for high correlation
+        columns = correlation_matrix.columns.to_numpy()
+        corr_pairs = list(zip(columns[rows[high_corr]], columns[cols[high_corr]], pair_values[high_corr]))
 
         for col1, col2, corr_value in corr_pairs:
             discovered_rules.append({
@@ -119,6 +257,27 @@ class RuleGenerator:
 
         return discovered_rules
 
+    @staticmethod
+    def _iqr_bounds(numeric_data):
+        """Compute the 1.5 IQR outlier bounds of every column, ignoring missing values.
+
+        Uses the parallel numba kernel when available, otherwise one vectorized pandas quantile call.
+        """
+        if _iqr_bounds_kernel is not None:
+            # One contiguous row per column, so each parallel iteration reads a single block of memory
+            columns = np.ascontiguousarray(numeric_data.to_numpy(dtype=np.float64, na_value=np.nan).T)
+            bounds = _iqr_bounds_kernel(columns)
+            return (
+                pd.Series(bounds[:, 0], index=numeric_data.columns),
+                pd.Series(bounds[:, 1], index=numeric_data.columns)
+            )
+
+        quantiles = numeric_data.quantile([0.25, 0.75])
+        Q1 = quantiles.loc[0.25]
+        Q3 = quantiles.loc[0.75]
+        IQR = Q3 - Q1
+        return Q1 - 1.5 * IQR, Q3 + 1.5 * IQR
+
     def create_great_expectations_suite(self, rule_templates, dataset_name):
         """Create a Great Expectations suite from rule templates."""
         context = ge.data_context.DataContext()
@@ -127,6 +286,9 @@ class RuleGenerator:
             overwrite_existing=True
         )
 
+        # Collect the expectations of all rules and add them to the suite together
+        expectations = []
+
         for rule in rule_templates:
             rule_type = rule.get("type", "")
             elements = rule.get("elements", [])
@@ -137,37 +299,27 @@ class RuleGenerator:
             primary_element = elements[0]
 
             if rule_type == "range_check":
-                # Extract bounds from logic
-                logic = rule.get("logic", "")
-                # Simple parsing for demonstration purposes
-                lower_bound = float('-inf')
-                upper_bound = float('inf')
-
-                if ">=" in logic:
-                    lower_bound = float(logic.split(">=")[1].split("AND")[0].strip())
-                if "<=" in logic:
-                    upper_bound = float(logic.split("<=")[1].strip())
-
-                suite.add_expectation(
+                # Use the structured bounds as given, including dates; None means unbounded
+                expectations.append(
                     ge.core.expectation_configuration.ExpectationConfiguration(
                         expectation_type="expect_column_values_to_be_between",
                         kwargs={
                             "column": primary_element,
-                            "min_value": lower_bound,
-                            "max_value": upper_bound
+                            "min_value": rule.get("lower_bound"),
+                            "max_value": rule.get("upper_bound")
                         }
                     )
                 )
 
             elif rule_type == "categorical_check":
-                # Extract valid values from logic
-                logic = rule.get("logic", "")
-                # Simple parsing for demonstration purposes
-                if "IN" in logic:
-                    valid_values = logic.split("IN")[1].strip()
+                valid_values = rule.get("valid_values")
+                if valid_values is None and "IN" in rule.get("logic", ""):
+                    # Extract valid values from the logic of rules without structured values
+                    valid_values = rule["logic"].split("IN")[1].strip()
                     valid_values = json.loads(valid_values.replace("'", "\""))
 
-                    suite.add_expectation(
+                if valid_values is not None:
+                    expectations.append(
                         ge.core.expectation_configuration.ExpectationConfiguration(
                             expectation_type="expect_column_values_to_be_in_set",
                             kwargs={
@@ -178,7 +330,7 @@ class RuleGenerator:
                     )
 
             elif rule_type == "not_null_check":
-                suite.add_expectation(
+                expectations.append(
                     ge.core.expectation_configuration.ExpectationConfiguration(
                         expectation_type="expect_column_values_to_not_be_null",
                         kwargs={
@@ -187,5 +339,6 @@ class RuleGenerator:
                     )
                 )
 
+        suite.add_expectation_configurations(expectations)
         context.save_expectation_suite(suite)
         return suite
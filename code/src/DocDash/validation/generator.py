@@ -1,44 +1,110 @@
-import os
+import io
 import json
-import tempfile
+import hashlib
+from string import Template
 from langchain.llms import OpenAI
+from DocDash.common.llm import LLM_CACHE_PATH, sqlite_llm_cache
 import pandas as pd
 import great_expectations as ge
 from great_expectations.core.batch import RuntimeBatchRequest
 from great_expectations.checkpoint import SimpleCheckpoint
 
 
-class ValidationCodeGenerator:
-    def __init__(self, model_name="gpt-4"):
-        """Initialize the validation code generator with specified LLM."""
-        self.llm = OpenAI(model_name=model_name)
+# Templates of the generated pandas validation code, filled in by string.Template substitution
+PANDAS_VALIDATION_TEMPLATE = Template("""
+import os
+import pandas as pd
+import numpy as np
+import json
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
 
-    def generate_validation_code(self, rule_templates):
-        """Generate executable Python code for validating data based on rule templates."""
-        prompt = f"""
-        Create Python code that implements the following validation rules:
+# Optional fused expression evaluation for range checks, used when numexpr is installed
+try:
+    import numexpr
+except ImportError:
+    numexpr = None
+
+# Value sets at least this large are matched through categorical codes instead of isin
+CATEGORICAL_LOOKUP_MIN_VALUES = 1000
+
+# Optional JIT-compiled range check, preferred over numexpr when numba and DocDash are importable;
+# it lives in a real module so numba caches its compiled code on disk
+try:
+    from DocDash.validation.kernels import out_of_range_kernel as _out_of_range_kernel
+except ImportError:
+    _out_of_range_kernel = None
+
+
+def _failed_result(df, mask):
+    \"\"\"Build a rule result from a boolean mask of the rows that failed the rule.\"\"\"
+    # Only the labels of the first failed rows are looked up; no filtered frame is built.
+    # Missing values in nullable boolean masks count as failures, as NaN comparisons do
+    if isinstance(mask, pd.Series):
+        mask = mask.to_numpy(dtype=bool, na_value=True)
+    failed_idx = np.flatnonzero(mask)
+    failed_records = df.index.to_numpy()[failed_idx[:100]].tolist()  # Limit to first 100 for readability
+
+    return {
+        "passed": failed_idx.size == 0,
+        "failed_records": failed_records
+    }
 
-        {json.dumps(rule_templates, indent=2)}
 
-        The code should:
-        1. Accept a pandas DataFrame as input
-        2. Apply each validation rule
-        3. Return a dictionary of validation results, including passed/failed status and details for each rule
+def _error_result(error):
+    \"\"\"Build the result of a rule whose check raised, so the other rules on the column still run.\"\"\"
+    return {"passed": False, "error_message": f"Error executing rule: {str(error)}"}
+
+
+def _out_of_range(column, lower_bound, upper_bound):
+    \"\"\"Build a boolean mask of the values outside the bounds; None means unbounded and missing values are out of range.\"\"\"
+    if not pd.api.types.is_numeric_dtype(column):
+        # Dates and other comparable values, e.g. a datetime column against pd.Timestamp bounds
+        in_range = column.notna()
+        if lower_bound is not None:
+            in_range &= column >= lower_bound
+        if upper_bound is not None:
+            in_range &= column <= upper_bound
+        return ~in_range
+
+    lower_bound = -np.inf if lower_bound is None else float(lower_bound)
+    upper_bound = np.inf if upper_bound is None else float(upper_bound)
+    values = column.to_numpy(dtype=np.float64, na_value=np.nan)
+    if _out_of_range_kernel is not None:
+        return _out_of_range_kernel(values, lower_bound, upper_bound)
+    if numexpr is not None:
+        # numexpr fuses both comparisons and the negation into one multi-threaded pass without temporaries
+        return numexpr.evaluate(
+            "~((values >= lower_bound) & (values <= upper_bound))",
+            local_dict={"values": values, "lower_bound": lower_bound, "upper_bound": upper_bound}
+        )
+    return ~((values >= lower_bound) & (values <= upper_bound))
 
-        Do not use external libraries beyond pandas, numpy, and standard Python libraries.
-        Make the code robust to handle edge cases like missing values and different data types.
-        """
 
-        validation_code = self.llm(prompt)
-        return validation_code
+def _not_in_set(column, valid_values):
+    \"\"\"Build a boolean mask of the values that are not in the frozenset of valid values.\"\"\"
+    if len(valid_values) >= CATEGORICAL_LOOKUP_MIN_VALUES:
+        # Large sets: one categorical encoding pass, where values outside the categories get code -1
+        return pd.Categorical(column, categories=list(valid_values)).codes == -1
+    return ~column.isin(valid_values)
+
+
+# Valid values of the categorical rules
+${value_sets}
+
+${column_functions}
+
+def _run_rule_group(rule_group, df):
+    \"\"\"Apply the validation function of all rules on a column, turning an exception into failed results.
+
+    Each check catches its own exceptions; this only handles failures outside of them, like the column lookup.
+    \"\"\"
+    try:
+        return rule_group["validation_function"](df)
+    except Exception as e:
+        # Handle exceptions during rule execution
+        return {rule_id: _error_result(e) for rule_id in rule_group["rules"]}
 
-    def generate_pandas_validation(self, rule_templates):
-        """Generate pandas-specific validation code."""
-        pandas_code_template = """
-import pandas as pd
-import numpy as np
-import json
-from datetime import datetime
 
 def validate_data(df):
     \"\"\"
@@ -60,22 +126,22 @@ def validate_data(df):
         "rule_results": {}
     }
 
-    # Make a copy to avoid modifying the original DataFrame
-    data = df.copy()
+    # Rules only read the DataFrame and build boolean masks; they must never modify it in place
 
-    # Define validation rules
+    # Define validation rules, grouped by the column they validate
     validation_rules = []
 
-    {rules_definition}
+${rules_definition}
 
-    # Execute validation rules
-    for rule in validation_rules:
-        rule_id = rule["rule_id"]
-        results["summary"]["total_rules"] += 1
+    # Execute validation rules; the column groups are independent and the vectorized checks release the GIL
+    with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
+        all_group_results = list(executor.map(lambda rule_group: _run_rule_group(rule_group, df), validation_rules))
 
-        try:
-            # Apply the rule's validation function
-            rule_result = rule["validation_function"](data)
+    # Collect the results by column group, in each group's rule order
+    for rule_group, group_results in zip(validation_rules, all_group_results):
+        for rule_id, rule in rule_group["rules"].items():
+            rule_result = group_results[rule_id]
+            results["summary"]["total_rules"] += 1
 
             # Store the result
             results["rule_results"][rule_id] = {
@@ -92,16 +158,6 @@ def validate_data(df):
             else:
                 results["summary"]["passed_rules"] += 1
 
-        except Exception as e:
-            # Handle exceptions during rule execution
-            results["summary"]["failed_rules"] += 1
-            results["rule_results"][rule_id] = {
-                "passed": False,
-                "description": rule["description"],
-                "severity": rule["severity"],
-                "error_message": f"Error executing rule: {str(e)}"
-            }
-
     return results
 
 if __name__ == "__main__":
@@ -110,10 +166,114 @@ if __name__ == "__main__":
     # validation_results = validate_data(df)
     # print(json.dumps(validation_results, indent=2))
     pass
-"""
+""")
+
+RANGE_CHECK_TEMPLATE = Template("""$comment
+    try:
+        results[$rule_id] = _failed_result(df, _out_of_range(column, $lower_bound, $upper_bound))
+    except Exception as e:
+        results[$rule_id] = _error_result(e)
+""")
+
+CATEGORICAL_CHECK_TEMPLATE = Template("""$comment
+    try:
+        results[$rule_id] = _failed_result(df, _not_in_set(column, $constant_name))
+    except Exception as e:
+        results[$rule_id] = _error_result(e)
+""")
+
+NOT_NULL_CHECK_TEMPLATE = Template("""$comment
+    try:
+        results[$rule_id] = _failed_result(df, column.isna())
+    except Exception as e:
+        results[$rule_id] = _error_result(e)
+""")
+
+CROSS_FIELD_CHECK_TEMPLATE = Template("""$comment
+    if $secondary_element not in df.columns:
+        results[$rule_id] = {"passed": False, "error_message": $missing_message}
+    else:
+        try:
+            results[$rule_id] = _failed_result(df, column != df[$secondary_element])
+        except Exception as e:
+            results[$rule_id] = _error_result(e)
+""")
+
+COLUMN_FUNCTION_TEMPLATE = Template("""
+def $function_name(df):
+    \"\"\"Run all rules on column $column, returning the result of each rule by rule ID.\"\"\"
+    if $column not in df.columns:
+        return {
+            rule_id: {"passed": False, "error_message": $missing_message}
+            for rule_id in $rule_ids
+        }
+
+    # Look the column up once for all of its rules
+    column = df[$column]
+    results = {}
+
+$checks
+    return results
+""")
 
-        # Generate rule definitions
-        rules_code = []
+RULE_GROUP_TEMPLATE = Template("""    validation_rules.append({
+        "rules": $rules,
+        "validation_function": $function_name
+    })
+""")
+
+
+class ValidationCodeGenerator:
+    # Loaded validate_data functions keyed by the SHA-256 of their code, shared by all generators
+    _validators = {}
+
+    def __init__(self, model_name="gpt-4", temperature=0, cache_path=LLM_CACHE_PATH):
+        """Initialize the validation code generator with specified LLM.
+
+        The temperature defaults to 0 rather than LangChain's 0.7, so responses are reproducible and
+        are cached in the SQLite database at cache_path unless it is None or the temperature is above zero.
+        """
+        llm_cache = sqlite_llm_cache(cache_path) if cache_path is not None and temperature == 0 else False
+
+        self.llm = OpenAI(model_name=model_name, temperature=temperature, cache=llm_cache)
+        # Generated pandas validation code keyed by the SHA-256 of the canonical rule templates JSON
+        self._code_cache = {}
+
+    def generate_validation_code(self, rule_templates):
+        """Generate executable Python code for validating data based on rule templates."""
+        prompt = f"""
+        Create Python code that implements the following validation rules:
+
+        {json.dumps(rule_templates, indent=2)}
+
+        The code should:
+        1. Accept a pandas DataFrame as input
+        2. Apply each validation rule
+        3. Return a dictionary of validation results, including passed/failed status and details for each rule
+
+        Do not use external libraries beyond pandas, numpy, and standard Python libraries.
+        Make the code robust to handle edge cases like missing values and different data types.
+        """
+
+        validation_code = self.llm(prompt)
+        return validation_code
+
+    def generate_pandas_validation(self, rule_templates):
+        """Generate pandas-specific validation code.
+
+        Rules are grouped by their primary column and each group becomes one generated function, so a
+        column is looked up once and all of its checks run together.
+        """
+        # Identical rule templates always generate identical code, so reuse it
+        key = hashlib.sha256(json.dumps(rule_templates, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+        if key in self._code_cache:
+            return self._code_cache[key]
+
+        # Generate the checks of each rule, grouped by primary column
+        column_checks = {}
+        rule_infos = {}
+        value_sets = io.StringIO()
+        value_set_count = 0
 
         for rule in rule_templates:
             rule_id = rule["rule_id"]
@@ -127,149 +287,120 @@ if __name__ == "__main__":
                 continue
 
             primary_element = elements[0]
+            # Keep the description on one line so it can be used in a comment
+            comment = f"    # Rule {rule_id}: {' '.join(str(description).split())}".rstrip()
 
             if rule_type == "range_check":
-                # Parse range bounds from logic
-                lower_bound = "float('-inf')"  # Default
-                upper_bound = "float('inf')"  # Default
-
-                if ">=" in logic:
-                    lower_bound = logic.split(">=")[1].split("AND")[0].strip()
-                if "<=" in logic:
-                    upper_bound = logic.split("<=")[1].strip()
-
-                validation_function = f"""
-    # Rule {rule_id}: {description}
-    validation_rules.append({{
-        "rule_id": "{rule_id}",
-        "description": "{description}",
-        "severity": "{severity}",
-        "validation_function": lambda df: {{
-            if "{primary_element}" not in df.columns:
-                return {{"passed": False, "error_message": "Column {primary_element} not found in DataFrame"}}
-
-            # Find values outside the acceptable range
-            mask = ~((df["{primary_element}"] >= {lower_bound}) & (df["{primary_element}"] <= {upper_bound}))
-            failed_records = df[mask].index.tolist()
-
-            return {{
-                "passed": len(failed_records) == 0,
-                "failed_records": failed_records[:100]  # Limit to first 100 for readability
-            }}
-        }}
-    }})
-"""
-                rules_code.append(validation_function)
+                # Find values outside the acceptable range, written from the structured bounds; None means unbounded
+                check = RANGE_CHECK_TEMPLATE.substitute(
+                    comment=comment,
+                    rule_id=repr(rule_id),
+                    lower_bound=self._bound_literal(rule.get("lower_bound")),
+                    upper_bound=self._bound_literal(rule.get("upper_bound"))
+                )
 
             elif rule_type == "categorical_check":
-                # Parse valid values from logic
                 valid_values = "[]"  # Default
 
-                if "IN" in logic:
+                if rule.get("valid_values") is not None:
+                    valid_values = repr(list(rule["valid_values"]))
+                elif "IN" in logic:
+                    # Parse valid values from the logic of rules without structured values
                     valid_values = logic.split("IN")[1].strip()
 
-                validation_function = f"""
-    # Rule {rule_id}: {description}
-    validation_rules.append({{
-        "rule_id": "{rule_id}",
-        "description": "{description}",
-        "severity": "{severity}",
-        "validation_function": lambda df: {{
-            if "{primary_element}" not in df.columns:
-                return {{"passed": False, "error_message": "Column {primary_element} not found in DataFrame"}}
-
-            valid_values = {valid_values}
-            # Find values not in the acceptable set
-            mask = ~df["{primary_element}"].isin(valid_values)
-            failed_records = df[mask].index.tolist()
-
-            return {{
-                "passed": len(failed_records) == 0,
-                "failed_records": failed_records[:100]  # Limit to first 100 for readability
-            }}
-        }}
-    }})
-"""
-                rules_code.append(validation_function)
+                # Hash the valid values once at module load instead of on every call
+                constant_name = f"_VALID_VALUES_{value_set_count}"
+                if value_set_count:
+                    value_sets.write("\n")
+                value_sets.write(f"{constant_name} = frozenset({valid_values})")
+                value_set_count += 1
+
+                # Find values not in the acceptable set
+                check = CATEGORICAL_CHECK_TEMPLATE.substitute(
+                    comment=comment, rule_id=repr(rule_id), constant_name=constant_name
+                )
 
             elif rule_type == "not_null_check":
-                validation_function = f"""
-    # Rule {rule_id}: {description}
-    validation_rules.append({{
-        "rule_id": "{rule_id}",
-        "description": "{description}",
-        "severity": "{severity}",
-        "validation_function": lambda df: {{
-            if "{primary_element}" not in df.columns:
-                return {{"passed": False, "error_message": "Column {primary_element} not found in DataFrame"}}
-
-            # Find null values
-            mask = df["{primary_element}"].isna()
-            failed_records = df[mask].index.tolist()
-
-            return {{
-                "passed": len(failed_records) == 0,
-                "failed_records": failed_records[:100]  # Limit to first 100 for readability
-            }}
-        }}
-    }})
-"""
-                rules_code.append(validation_function)
+                # Find null values
+                check = NOT_NULL_CHECK_TEMPLATE.substitute(comment=comment, rule_id=repr(rule_id))
 
             elif rule_type == "cross_field_check" and len(elements) >= 2:
                 # More complex handling for cross-field validations
                 secondary_element = elements[1]
 
                 # Default cross-field check is equality
-                validation_function = f"""
-    # Rule {rule_id}: {description}
-    validation_rules.append({{
-        "rule_id": "{rule_id}",
-        "description": "{description}",
-        "severity": "{severity}",
-        "validation_function": lambda df: {{
-            if "{primary_element}" not in df.columns or "{secondary_element}" not in df.columns:
-                missing_cols = [col for col in ["{primary_element}", "{secondary_element}"] if col not in df.columns]
-                return {{"passed": False, "error_message": f"Columns {{missing_cols}} not found in DataFrame"}}
-
-            # Find records where the cross-field validation fails
-            # This is a simplified check - customize based on the specific logic
-            mask = df["{primary_element}"] != df["{secondary_element}"]
-            failed_records = df[mask].index.tolist()
-
-            return {{
-                "passed": len(failed_records) == 0,
-                "failed_records": failed_records[:100]  # Limit to first 100 for readability
-            }}
-        }}
-    }})
-"""
-                rules_code.append(validation_function)
+                # This is a simplified check - customize based on the specific logic
+                check = CROSS_FIELD_CHECK_TEMPLATE.substitute(
+                    comment=comment,
+                    rule_id=repr(rule_id),
+                    secondary_element=repr(secondary_element),
+                    missing_message=repr(f"Columns {[secondary_element]} not found in DataFrame")
+                )
+
+            else:
+                continue
+
+            column_checks.setdefault(primary_element, []).append((rule_id, check))
+            rule_infos[rule_id] = {"description": description, "severity": severity}
+
+        # Generate one validation function per column and register it with the rules it checks
+        column_functions = io.StringIO()
+        rules_code = io.StringIO()
+
+        for column_number, (column, checks) in enumerate(column_checks.items()):
+            function_name = f"_validate_column_{column_number}"
+            rule_ids = [rule_id for rule_id, _ in checks]
+
+            if column_number:
+                column_functions.write("\n")
+                rules_code.write("\n")
+
+            column_functions.write(COLUMN_FUNCTION_TEMPLATE.substitute(
+                function_name=function_name,
+                column=repr(column),
+                missing_message=repr(f"Column {column} not found in DataFrame"),
+                rule_ids=repr(rule_ids),
+                checks="".join(check for _, check in checks)
+            ))
+
+            rules = {rule_id: rule_infos[rule_id] for rule_id in rule_ids}
+            rules_code.write(RULE_GROUP_TEMPLATE.substitute(rules=repr(rules), function_name=function_name))
 
         # Complete the template with the rules
-        complete_code = pandas_code_template.format(rules_definition="\n".join(rules_code))
+        complete_code = PANDAS_VALIDATION_TEMPLATE.substitute(
+            value_sets=value_sets.getvalue(),
+            column_functions=column_functions.getvalue(),
+            rules_definition=rules_code.getvalue()
+        )
+        self._code_cache[key] = complete_code
         return complete_code
 
+    @staticmethod
+    def _bound_literal(bound):
+        """Write a range bound as a Python literal: a float, a pd.Timestamp for dates, or a quoted string."""
+        if bound is None:
+            return "None"
+        if isinstance(bound, (int, float)) and not isinstance(bound, bool):
+            return repr(float(bound))
+        try:
+            return f"pd.Timestamp({pd.Timestamp(bound).isoformat()!r})"
+        except (TypeError, ValueError):
+            return repr(str(bound))
+
     def execute_validation_on_data(self, validation_code, data):
         """Execute the generated validation code on the provided data."""
-        # Write the validation code to a temporary file
-        with tempfile.NamedTemporaryFile(suffix='.py', delete=False) as tmp:
-            tmp.write(validation_code.encode('utf-8'))
-            tmp_path = tmp.name
-
-        try:
-            # Import the validation module
-            import importlib.util
-            spec = importlib.util.spec_from_file_location("validation_module", tmp_path)
-            validation_module = importlib.util.module_from_spec(spec)
-            spec.loader.exec_module(validation_module)
-
-            # Execute validation
-            results = validation_module.validate_data(data)
-            return results
-        finally:
-            # Clean up the temporary file
-            os.unlink(tmp_path)
+        key = hashlib.sha256(validation_code.encode("utf-8")).hexdigest()
+        validate_data = self._validators.get(key)
+
+        if validate_data is None:
+            # Compile and run the validation code in its own namespace, without a module file on disk
+            namespace = {"__name__": "validation_module"}
+            exec(compile(validation_code, "<validator>", "exec"), namespace)
+            validate_data = namespace["validate_data"]
+            self._validators[key] = validate_data
+
+        # Execute validation
+        return validate_data(data)
 
     def execute_great_expectations_validation(self, data, suite_name, dataset_name):
         """Run Great Expectations validation on the data using the specified suite."""
@@ -0,0 +1,22 @@
+import numpy as np
+
+# Optional JIT-compiled kernels for generated validation code, used when numba is installed
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
+if njit is not None:
+    # Serial and GIL-free: the generated validators run their columns on a thread pool, which supplies the
+    # parallelism; numba's default threading layer must not be entered by several threads at once
+    @njit(cache=True, nogil=True)
+    def out_of_range_kernel(values, lower_bound, upper_bound):
+        """Flag the values outside the bounds, including NaNs, in one pass."""
+        out = np.zeros(values.shape[0], dtype=np.bool_)
+        for i in range(values.shape[0]):
+            value = values[i]
+            if value != value or value < lower_bound or value > upper_bound:
+                out[i] = True
+        return out
+else:
+    out_of_range_kernel = None
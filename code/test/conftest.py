@@ -0,0 +1,8 @@
+import os
+import sys
+
+# Import the DocDash packages from the source tree
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+# The LLM clients are created eagerly and need a key, but no test calls the API
+os.environ.setdefault("OPENAI_API_KEY", "test-key")
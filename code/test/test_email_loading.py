@@ -0,0 +1,21 @@
+import os
+from email.message import EmailMessage
+
+from DocDash.doc.processor import _load_document
+
+
+def test_email_attachments_are_loaded_and_removed(tmp_path):
+    msg = EmailMessage()
+    msg["Subject"] = "Quarterly filing"
+    msg.set_content("See the attached limits.")
+    msg.add_attachment(b"amount must not exceed 1000", maintype="text", subtype="plain", filename="limits.txt")
+    email_path = tmp_path / "filing.eml"
+    email_path.write_bytes(msg.as_bytes())
+
+    document = _load_document(str(email_path))
+
+    assert "error" not in document
+    assert document["content"] == "See the attached limits."
+    assert [attachment["content"] for attachment in document["attachments"]] == ["amount must not exceed 1000"]
+    assert os.path.basename(document["attachments"][0]["path"]).endswith("_limits.txt")
+    assert not os.path.exists(os.path.dirname(document["attachments"][0]["path"]))
@@ -0,0 +1,88 @@
+import pytest
+
+from DocDash.common.llm import JsonComplete, JsonStreamCollector
+
+
+def stream(tokens, strict=True):
+    """Feed tokens to a collector until it stops the stream, returning the collector."""
+    collector = JsonStreamCollector(strict=strict)
+    with pytest.raises(JsonComplete):
+        for token in tokens:
+            collector.on_llm_new_token(token)
+    return collector
+
+
+def test_brackets_inside_strings_are_ignored():
+    collector = stream(['{"rule": "x in [1, 2}", "note": "{"}'])
+    assert collector.text() == '{"rule": "x in [1, 2}", "note": "{"}'
+
+
+def test_escaped_quotes_stay_inside_the_string():
+    collector = stream(['{"text": "say \\"}\\" now"}'])
+    assert collector.text() == '{"text": "say \\"}\\" now"}'
+
+
+def test_value_split_across_tokens():
+    collector = stream(['[{"a"', ': [1,', ' 2]}', ', {"b": "c', '"}', ']'])
+    assert collector.text() == '[{"a": [1, 2]}, {"b": "c"}]'
+
+
+def test_stops_as_soon_as_the_value_is_complete():
+    collector = JsonStreamCollector()
+    tokens = ['{"a": 1}', ' and some explanation', ' that is never read']
+    consumed = []
+    with pytest.raises(JsonComplete):
+        for token in tokens:
+            consumed.append(token)
+            collector.on_llm_new_token(token)
+    assert consumed == ['{"a": 1}']
+    assert collector.text() == '{"a": 1}'
+
+
+def test_strict_mode_rejects_mismatched_brackets():
+    collector = JsonStreamCollector()
+    with pytest.raises(ValueError, match="Malformed JSON"):
+        collector.on_llm_new_token('{"a": [1, 2}')
+
+
+def test_lenient_mode_skips_mismatched_brackets():
+    collector = JsonStreamCollector(strict=False)
+    collector.on_llm_new_token('{"a": [1, 2}')
+    assert collector.end is None
+
+
+def test_prose_before_the_json_is_skipped():
+    collector = stream(['Here is the plan:\n```json\n', '{"explanation": "ok"}', '\n```'])
+    assert collector.text() == '{"explanation": "ok"}'
+
+
+def test_bracketed_prose_is_not_taken_for_the_json():
+    collector = stream(['The rules [R1, R2]: ', '[{"rule_id": "R1"}, ', '{"rule_id": "R2"}]'])
+    assert collector.text() == '[{"rule_id": "R1"}, {"rule_id": "R2"}]'
+
+
+class FakeStreamingChain:
+    """A chain that streams its tokens to the callbacks and returns the full text, like a streaming LLMChain."""
+
+    def __init__(self, tokens):
+        self.tokens = tokens
+
+    def run(self, callbacks, **inputs):
+        for token in self.tokens:
+            for callback in callbacks:
+                callback.on_llm_new_token(token)
+        return "".join(self.tokens)
+
+
+def test_run_json_chain_returns_the_json_once_complete():
+    from DocDash.doc.processor import DocumentProcessor
+
+    chain = FakeStreamingChain(['Classification: ', '{"type": "report"}', ' Hope this helps!'])
+    assert DocumentProcessor._run_json_chain(chain) == '{"type": "report"}'
+
+
+def test_run_json_chain_returns_the_full_text_without_json():
+    from DocDash.doc.processor import DocumentProcessor
+
+    chain = FakeStreamingChain(['No JSON ', 'here'])
+    assert DocumentProcessor._run_json_chain(chain) == 'No JSON here'
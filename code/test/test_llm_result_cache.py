@@ -0,0 +1,54 @@
+import asyncio
+
+import pytest
+
+from DocDash.doc import processor as doc_processor
+from DocDash.doc.processor import DocumentProcessor, cached_llm
+
+
+class FakeEncoding:
+    """Counts one token per word, so tests don't need to download the tiktoken encodings."""
+
+    def encode(self, text, disallowed_special=()):
+        return text.split()
+
+
+class CountingProcessor(DocumentProcessor):
+    calls = 0
+
+    @cached_llm(stage="extract")
+    def extract(self, document_content, document_path=None):
+        self.calls += 1
+        return {"data_elements": [{"name": "amount"}]}
+
+    @cached_llm(stage="extract")
+    async def aextract(self, document_content, document_path=None):
+        self.calls += 1
+        return {"data_elements": [{"name": "amount"}]}
+
+
+@pytest.fixture
+def processor(monkeypatch):
+    monkeypatch.setattr(doc_processor.tiktoken, "encoding_for_model", lambda model_name: FakeEncoding())
+    return CountingProcessor(semantic_threshold=None)
+
+
+def test_modifying_a_result_does_not_change_the_cache(processor):
+    first = processor.extract("Amount: 100", "/tmp/a/report.txt")
+    first["data_elements"].append({"name": "added by the caller"})
+
+    second = processor.extract("Amount: 100", "/tmp/b/report.txt")
+    second["data_elements"][0]["name"] = "renamed by the caller"
+
+    assert processor.calls == 1
+    assert processor.extract("Amount: 100", "report.txt") == {"data_elements": [{"name": "amount"}]}
+
+
+def test_modifying_an_async_result_does_not_change_the_cache(processor):
+    async def scenario():
+        first = await processor.aextract("Amount: 100")
+        first["data_elements"].clear()
+        return await processor.aextract("Amount: 100")
+
+    assert asyncio.run(scenario()) == {"data_elements": [{"name": "amount"}]}
+    assert processor.calls == 1
@@ -0,0 +1,102 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from DocDash.validation.generator import ValidationCodeGenerator
+
+
+@pytest.fixture
+def validation_generator():
+    return ValidationCodeGenerator(cache_path=None)
+
+
+@pytest.fixture
+def data():
+    return pd.DataFrame(
+        {
+            "amount": [10.0, -5.0, np.nan, 250.0],
+            "status": ["open", "closed", "unknown", "open"],
+            "owner": ["a", None, "c", None],
+            "limit": [10.0, 0.0, 5.0, 300.0],
+        },
+        index=[100, 101, 102, 103],
+    )
+
+
+def run(validation_generator, rules, data):
+    code = validation_generator.generate_pandas_validation(rules)
+    return validation_generator.execute_validation_on_data(code, data)
+
+
+def test_failed_records_of_range_enum_and_null_rules(validation_generator, data):
+    rules = [
+        {"rule_id": "amount_range", "elements": ["amount"], "type": "range_check",
+         "lower_bound": 0, "upper_bound": 100, "description": "Amount between 0 and 100"},
+        {"rule_id": "status_values", "elements": ["status"], "type": "categorical_check",
+         "valid_values": ["open", "closed"], "description": "Known status"},
+        {"rule_id": "owner_present", "elements": ["owner"], "type": "not_null_check",
+         "description": "Owner is set"},
+        {"rule_id": "amount_present", "elements": ["amount"], "type": "not_null_check",
+         "description": "Amount is set"},
+    ]
+
+    results = run(validation_generator, rules, data)
+    rule_results = results["rule_results"]
+
+    # Missing values are out of range; failed records are index labels
+    assert rule_results["amount_range"]["failed_records"] == [101, 102, 103]
+    assert rule_results["status_values"]["failed_records"] == [102]
+    assert rule_results["owner_present"]["failed_records"] == [101, 103]
+    assert rule_results["amount_present"]["failed_records"] == [102]
+    assert results["summary"] == {
+        "total_rules": 4,
+        "passed_rules": 0,
+        "failed_rules": 4,
+        "validation_timestamp": results["summary"]["validation_timestamp"],
+    }
+
+
+def test_passing_rules_report_no_failed_records(validation_generator, data):
+    rules = [{"rule_id": "limit_range", "elements": ["limit"], "type": "range_check",
+              "lower_bound": 0, "upper_bound": None, "description": "Limit is not negative"}]
+
+    rule_result = run(validation_generator, rules, data)["rule_results"]["limit_range"]
+
+    assert rule_result["passed"]
+    assert "failed_records" not in rule_result
+
+
+def test_a_raising_rule_is_isolated_from_the_rules_on_its_column(validation_generator, data):
+    rules = [
+        # Comparing the numeric column against a string bound raises inside the check
+        {"rule_id": "amount_bad_bound", "elements": ["amount"], "type": "range_check",
+         "lower_bound": "not a number", "upper_bound": None, "description": "Broken rule"},
+        {"rule_id": "amount_present", "elements": ["amount"], "type": "not_null_check",
+         "description": "Amount is set"},
+        {"rule_id": "amount_matches_limit", "elements": ["amount", "limit"], "type": "cross_field_check",
+         "description": "Amount equals the limit"},
+    ]
+
+    rule_results = run(validation_generator, rules, data)["rule_results"]
+
+    assert not rule_results["amount_bad_bound"]["passed"]
+    assert rule_results["amount_bad_bound"]["error_message"].startswith("Error executing rule")
+    assert rule_results["amount_present"]["failed_records"] == [102]
+    assert rule_results["amount_present"]["error_message"] == ""
+    assert rule_results["amount_matches_limit"]["failed_records"] == [101, 102, 103]
+
+
+def test_missing_columns_fail_their_rules_only(validation_generator, data):
+    rules = [
+        {"rule_id": "missing_column", "elements": ["nope"], "type": "not_null_check", "description": "Missing"},
+        {"rule_id": "missing_other", "elements": ["amount", "nope"], "type": "cross_field_check",
+         "description": "Missing other column"},
+        {"rule_id": "status_values", "elements": ["status"], "type": "categorical_check",
+         "valid_values": ["open", "closed", "unknown"], "description": "Known status"},
+    ]
+
+    rule_results = run(validation_generator, rules, data)["rule_results"]
+
+    assert rule_results["missing_column"]["error_message"] == "Column nope not found in DataFrame"
+    assert rule_results["missing_other"]["error_message"] == "Columns ['nope'] not found in DataFrame"
+    assert rule_results["status_values"]["passed"]
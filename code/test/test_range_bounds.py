@@ -0,0 +1,64 @@
+import pandas as pd
+import pytest
+
+from DocDash.rule.generator import RuleGenerator
+from DocDash.validation.generator import ValidationCodeGenerator
+
+
+@pytest.fixture
+def validation_generator():
+    return ValidationCodeGenerator(cache_path=None)
+
+
+def range_rule(rule_number, element, minimum, maximum):
+    return RuleGenerator._rule_from_requirement(rule_number, {
+        "element": element,
+        "check_type": "range_check",
+        "params": {"min": minimum, "max": maximum}
+    })
+
+
+def test_requirement_bounds_keep_their_type():
+    assert range_rule(1, "amount", "1,000", 5)["lower_bound"] == 1000.0
+    assert range_rule(1, "amount", "1,000", 5)["upper_bound"] == 5.0
+    assert range_rule(2, "opened", "2024-01-01", None)["lower_bound"] == "2024-01-01"
+    assert range_rule(2, "opened", "2024-01-01", None)["upper_bound"] is None
+
+
+def test_llm_range_rule_bounds_are_read_once_from_the_logic():
+    rule = {"rule_id": "r1", "type": "range_check", "logic": "opened >= 2024-01-01 AND opened <= 2024-12-31"}
+    RuleGenerator._add_structured_bounds(rule)
+    assert rule["lower_bound"] == "2024-01-01"
+    assert rule["upper_bound"] == "2024-12-31"
+
+
+def test_date_string_and_formatted_bounds_validate(validation_generator):
+    rules = [
+        range_rule(1, "opened", "2024-01-01", "2024-12-31"),
+        range_rule(2, "grade", "B", None),
+        range_rule(3, "amount", "1,000", None),
+    ]
+    data = pd.DataFrame({
+        "opened": pd.to_datetime(["2024-03-01", "2023-12-31", None]),
+        "grade": ["C", "A", "B"],
+        "amount": [1500, 999, 1000],
+    })
+
+    code = validation_generator.generate_pandas_validation(rules)
+    results = validation_generator.execute_validation_on_data(code, data)["rule_results"]
+
+    assert results["req_001_opened"]["failed_records"] == [1, 2]
+    assert results["req_002_grade"]["failed_records"] == [1]
+    assert results["req_003_amount"]["failed_records"] == [1]
+
+
+def test_bound_of_the_wrong_type_fails_only_its_rule(validation_generator):
+    rules = [range_rule(1, "amount", "2024-01-01", None), range_rule(2, "amount", 0, 10)]
+    data = pd.DataFrame({"amount": [5, 20]})
+
+    code = validation_generator.generate_pandas_validation(rules)
+    results = validation_generator.execute_validation_on_data(code, data)["rule_results"]
+
+    assert not results["req_001_amount"]["passed"]
+    assert results["req_001_amount"]["error_message"].startswith("Error executing rule")
+    assert results["req_002_amount"]["failed_records"] == [1]
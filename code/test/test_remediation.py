@@ -0,0 +1,135 @@
+import asyncio
+import time
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from DocDash.fixer import recommender
+from DocDash.fixer.recommender import RateLimiter, RemediationRecommender
+
+
+class FakeEncoding:
+    """Counts one token per word, so tests don't need to download the tiktoken encodings."""
+
+    def encode(self, text, disallowed_special=()):
+        return text.split()
+
+
+@pytest.fixture
+def remediation_recommender(monkeypatch):
+    monkeypatch.setattr(recommender.tiktoken, "encoding_for_model", lambda model_name: FakeEncoding())
+    return RemediationRecommender(cache_path=None)
+
+
+@pytest.fixture
+def failed_rule_details():
+    return [
+        ("amount_range", {"type": "range_check", "severity": "error"}, {"failed_records": [1, 2]}, []),
+        ("status_values", {"type": "categorical_check", "severity": "warning"}, {"failed_records": [3]}, []),
+    ]
+
+
+def test_rate_limiter_caps_concurrent_requests():
+    async def scenario():
+        limiter = RateLimiter(max_concurrency=2)
+        running = 0
+        peak = 0
+
+        async def request():
+            nonlocal running, peak
+            async with limiter.semaphore:
+                await limiter.wait(1)
+                running += 1
+                peak = max(peak, running)
+                await asyncio.sleep(0.01)
+                running -= 1
+
+        await asyncio.gather(*[request() for _ in range(6)])
+        return peak
+
+    assert asyncio.run(scenario()) == 2
+
+
+def test_rate_limiter_paces_to_the_token_budget():
+    async def scenario():
+        # 6000 tokens per minute refill at 100 tokens per second
+        limiter = RateLimiter(max_concurrency=4, tokens_per_minute=6000)
+        await limiter.wait(6000)
+        start = time.monotonic()
+        await limiter.wait(20)
+        return time.monotonic() - start
+
+    assert asyncio.run(scenario()) >= 0.15
+
+
+def test_rate_limiter_paces_to_the_request_budget():
+    async def scenario():
+        # 600 requests per minute refill at 10 requests per second
+        limiter = RateLimiter(max_concurrency=4, requests_per_minute=600)
+        limiter.available_requests = 0
+        start = time.monotonic()
+        await limiter.wait(1)
+        return time.monotonic() - start
+
+    assert asyncio.run(scenario()) >= 0.05
+
+
+def test_rate_limiter_lets_oversized_requests_through_on_a_full_bucket():
+    async def scenario():
+        limiter = RateLimiter(max_concurrency=1, tokens_per_minute=100)
+        await asyncio.wait_for(limiter.wait(10000), timeout=1)
+
+    asyncio.run(scenario())
+
+
+def test_batched_remediations_are_keyed_by_rule_and_completed(remediation_recommender, failed_rule_details):
+    response = """Here are the plans:
+```json
+[
+    {"rule_id": "amount_range", "explanation": "Negative amounts", "remediation_steps": ["Fix sign"],
+     "can_automate": true, "automation_code": "df['amount'] = df['amount'].abs()",
+     "auditor_explanation": "Sign errors"},
+    {"rule_id": "status_values", "explanation": "Typos in status"},
+    {"rule_id": "not_requested", "explanation": "Ignored"}
+]
+```"""
+
+    plans = remediation_recommender._parse_batched_remediations(response, failed_rule_details)
+
+    assert set(plans) == {"amount_range", "status_values"}
+    assert plans["amount_range"]["can_automate"] is True
+    assert plans["amount_range"]["rule_type"] == "range_check"
+    assert plans["status_values"]["severity"] == "warning"
+    # Missing keys are filled in so the plan can be reported
+    assert plans["status_values"]["remediation_steps"] == "Not provided"
+    assert plans["status_values"]["can_automate"] == "Not provided"
+
+
+@pytest.mark.parametrize("response", ["Sorry, I cannot help with that.", '{"rule_id": "amount_range"}'])
+def test_unusable_batched_responses_leave_rules_for_individual_retries(
+        remediation_recommender, failed_rule_details, response):
+    assert remediation_recommender._parse_batched_remediations(response, failed_rule_details) == {}
+
+
+def test_batch_prompt_carries_the_rule_result_summary(remediation_recommender, failed_rule_details):
+    prompt = remediation_recommender._batch_remediation_prompt(failed_rule_details)
+
+    assert '"rule_result_summary":{"passed":null,"failed_count":2,"sample_failed_records":[1,2]}' in prompt
+
+
+def test_remediation_code_can_use_pandas_numpy_and_json_without_importing_them():
+    code = """
+def remediate(df):
+    df = df.copy()
+    df["amount"] = np.where(df["amount"] < 0, np.nan, df["amount"])
+    df["tags"] = df["tags"].map(json.loads)
+    return pd.DataFrame(df)
+"""
+    remediate = RemediationRecommender._compile_remediation(code)
+    data = pd.DataFrame({"amount": [-5.0, 10.0], "tags": ['["a"]', "[]"]})
+
+    result = remediate(data)
+
+    assert np.isnan(result["amount"][0]) and result["amount"][1] == 10.0
+    assert result["tags"].tolist() == [["a"], []]
@@ -0,0 +1,79 @@
+import pytest
+
+from DocDash.instruction import processing
+from DocDash.instruction.processing import RegulatoryInstructionProcessor
+
+
+class FakeLLM:
+    """Returns a canned response and records the prompts it was called with."""
+
+    def __init__(self, response):
+        self.response = response
+        self.prompts = []
+
+    def __call__(self, prompt):
+        self.prompts.append(prompt)
+        return self.response
+
+
+class FakeVectorStore:
+    def as_retriever(self, search_kwargs=None):
+        return None
+
+
+class FakeChain:
+    def __init__(self, response):
+        self.response = response
+
+    def run(self, query):
+        return self.response
+
+
+@pytest.fixture
+def processor():
+    return RegulatoryInstructionProcessor(cache_path=None)
+
+
+def test_refined_requirements_are_parsed_from_surrounding_prose(processor):
+    processor.llm = FakeLLM("""Here are the refined requirements:
+[
+    {"element": "amount", "check_type": "range_check", "params": {"min": 0, "max": 1000000},
+     "severity": "error", "description": "Amount must be between 0 and 1,000,000"},
+    {"element": "status", "check_type": "categorical_check", "params": {"values": ["open", "closed"]},
+     "severity": "warning", "description": "Status must be open or closed"}
+]
+Let me know if you need anything else.""")
+
+    requirements = processor.refine_requirements({"required_fields": ["amount"]})
+
+    assert [requirement["element"] for requirement in requirements] == ["amount", "status"]
+    assert requirements[0]["params"] == {"min": 0, "max": 1000000}
+    assert "required_fields" in processor.llm.prompts[0]
+
+
+def test_unparseable_refined_requirements_are_returned_as_text(processor):
+    response = "Amount must be positive [see section 4.2] and status must be set."
+    processor.llm = FakeLLM(response)
+
+    assert processor.refine_requirements("Amount must be positive") == response
+
+
+def test_extracted_requirements_are_grouped_by_kind(processor, monkeypatch):
+    monkeypatch.setattr(processing.RetrievalQA, "from_chain_type", lambda **kwargs: FakeChain(
+        'Sure: {"required_fields": ["amount"], "data_types": {"amount": "numeric"}}'))
+    processor.vector_db = FakeVectorStore()
+
+    assert processor.extract_validation_requirements() == {
+        "allowable_values": {},
+        "required_fields": ["amount"],
+        "cross_validations": [],
+        "data_types": {"amount": "numeric"}
+    }
+
+
+@pytest.mark.parametrize("response", ["No requirements were found.", '["amount", "status"]'])
+def test_extracted_requirements_fall_back_to_the_raw_response(processor, monkeypatch, response):
+    monkeypatch.setattr(processing.RetrievalQA, "from_chain_type", lambda **kwargs: FakeChain(response))
+    processor.vector_db = FakeVectorStore()
+
+    assert processor.extract_validation_requirements() == response